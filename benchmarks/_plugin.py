@@ -0,0 +1,17 @@
+"""Import plugin submodules without running the NoneBot plugin ``__init__``."""
+import importlib
+import sys
+import types
+from pathlib import Path
+
+PLUGIN_DIR = Path(__file__).resolve().parent.parent / "src" / "plugins" / "bot_manager"
+PACKAGE = "bot_manager"
+
+
+def load_plugin_module(name: str):
+    if PACKAGE not in sys.modules:
+        # Bare package object: relative imports between submodules still work
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [str(PLUGIN_DIR)]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{name}")
@@ -0,0 +1,71 @@
+"""Compare resident bytes per history event: tuple lists vs. the packed window store.
+
+Usage: python benchmarks/history_memory.py [--groups N] [--senders M] [--events E]
+"""
+import argparse
+import random
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from _plugin import load_plugin_module
+
+window_module = load_plugin_module("window")
+
+
+def make_events(groups: int, senders: int, events: int, span: float):
+    rng = random.Random(0)
+    result = []
+    for i in range(events):
+        result.append((
+            rng.randrange(groups) + 100000000,
+            rng.randrange(senders) + 1000000000,
+            rng.choice((0, 0, 0, 2000000000)),
+            span * i / events,
+            rng.randrange(1, 2**31),
+        ))
+    return result
+
+
+def fill_tuples(events) -> object:
+    history: Dict[int, List[Tuple[int, int, float, int]]] = {}
+    for group_id, sender_id, target_id, ts, mid in events:
+        history.setdefault(group_id, []).append((sender_id, target_id, ts, mid))
+    return history
+
+
+def fill_window(events) -> object:
+    window = window_module.SlidingWindow(30, 240)
+    for group_id, sender_id, target_id, ts, mid in events:
+        window.observe(group_id, sender_id, mid, (target_id,) if target_id else (), ts)
+    return window
+
+
+def measure(fill: Callable, events) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = fill(events)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0] if __doc__ else None)
+    parser.add_argument("--groups", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=5)
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+
+    # All events fall inside HISTORY_WINDOW=240 s, i.e. the worst case we retain
+    events = make_events(args.groups, args.senders, args.events, span=239)
+    tuple_bytes = measure(fill_tuples, events)
+    window_bytes = measure(fill_window, events)
+    print(f"events: {args.events} ({args.groups} groups x {args.senders} senders)")
+    print(f"tuple lists : {tuple_bytes / args.events:8.1f} bytes/event")
+    print(f"packed store: {window_bytes / args.events:8.1f} bytes/event")
+    print(f"ratio       : {tuple_bytes / max(window_bytes, 1):8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Replay recorded OneBot group message events through the detection pipeline.
+
+    python benchmarks/replay.py generate --groups 100 --bots 6 --events 100000 -o events.jsonl
+    python benchmarks/replay.py run events.jsonl --bots-file events.jsonl.bots.json
+
+``run`` feeds each event through the same rule and Detector as handle_monitor,
+against a mock Bot that records set_group_ban/delete_msg/send_group_msg calls,
+and reports throughput, per-event latency, peak memory and every ban decision.
+Events are OneBot v11 ``message`` payloads (one JSON object per line); the
+``time`` field drives the detection windows, so replays are deterministic.
+
+Needs the project dependencies (nonebot2, nonebot-adapter-onebot) installed,
+but not a running NoneBot instance.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from _plugin import load_plugin_module
+
+_CQ_CODE = re.compile(r"\[CQ:(at|reply),([^\]]*)\]")
+_CQ_ANY = re.compile(r"\[CQ:[^\]]*\]")
+
+
+class MockBot:
+    """Stands in for the OneBot connection and records every moderation call."""
+
+    def __init__(self, self_id: str = "10000"):
+        self.self_id = self_id
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+
+    async def call_api(self, api: str, **data: Any) -> Any:
+        self.calls.append((api, data))
+
+    async def set_group_ban(self, **data: Any):
+        await self.call_api("set_group_ban", **data)
+
+    async def delete_msg(self, **data: Any):
+        await self.call_api("delete_msg", **data)
+
+    async def send_group_msg(self, **data: Any):
+        await self.call_api("send_group_msg", **data)
+
+
+def parse_segments(message: Any) -> Tuple[List[Any], Optional[int], str]:
+    """@ targets, replied-to message id and plain text of an array or CQ-string message."""
+    at_targets: List[Any] = []
+    reply_id: Optional[int] = None
+    if isinstance(message, str):
+        for kind, params in _CQ_CODE.findall(message):
+            data = dict(p.split("=", 1) for p in params.split(",") if "=" in p)
+            if kind == "at":
+                at_targets.append(data.get("qq"))
+            elif data.get("id", "").lstrip("-").isdigit():
+                reply_id = int(data["id"])
+        return at_targets, reply_id, _CQ_ANY.sub("", message)
+    texts: List[str] = []
+    for seg in message or []:
+        data = seg.get("data") or {}
+        if seg.get("type") == "at":
+            at_targets.append(data.get("qq"))
+        elif seg.get("type") == "reply" and str(data.get("id", "")).lstrip("-").isdigit():
+            reply_id = int(data["id"])
+        elif seg.get("type") == "text":
+            texts.append(str(data.get("text", "")))
+    return at_targets, reply_id, "".join(texts)
+
+
+def load_bots(path: Optional[str], inline: Optional[str]) -> Optional[Dict[int, Set[int]]]:
+    scopes: Dict[int, Set[int]] = {}
+    if path:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        scopes[0] = {int(qq) for qq in data.get("bots", [])}
+        for group_id, bots in data.get("groups", {}).items():
+            scopes[int(group_id)] = {int(qq) for qq in bots}
+    if inline:
+        scopes.setdefault(0, set()).update(int(qq) for qq in inline.split(",") if qq.strip())
+    return scopes or None
+
+
+def _peak_rss_text() -> str:
+    try:
+        import resource
+    except ImportError:
+        # No getrusage on Windows; --trace-memory still works there
+        return "unavailable"
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    if sys.platform != "darwin":
+        peak *= 1024
+    return f"{peak / 1048576:.1f} MiB (peak resident)"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def replay(args) -> int:
+    if not args.verbose:
+        from nonebot.log import logger
+
+        # Keep per-event log lines out of the timings
+        logger.remove()
+
+    data_manager = load_plugin_module("data_manager")
+    detector_module = load_plugin_module("detector")
+    graph_module = load_plugin_module("graph")
+    moderation = load_plugin_module("moderation")
+    prefilter = load_plugin_module("prefilter")
+    state_module = load_plugin_module("state")
+    storage = load_plugin_module("storage")
+
+    settings = detector_module.DetectionSettings(
+        history_window=args.history_window,
+        detection_window=args.detection_window,
+        interaction_threshold=args.interaction_threshold,
+        spam_threshold=args.spam_threshold,
+        ban_duration=args.ban_duration,
+    )
+    state = state_module.create_detection_state(
+        args.backend, args.backend_url, settings.detection_window,
+        settings.history_window, settings.ban_duration,
+    )
+    graph = graph_module.InteractionGraph(
+        args.cycle_half_life or settings.detection_window * 4, args.cycle_min_weight, args.cycle_max_length
+    )
+    # No rate limit or retries: the mock answers instantly
+    recall_queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=0, retry_delay=0)
+    detector = detector_module.Detector(state, graph, recall_queue, settings)
+    decisions: List[Any] = []
+    detector.listeners.append(decisions.append)
+
+    manager = data_manager.BotManager(storage.MemoryBotStorage())
+    scopes = load_bots(args.bots_file, args.bots)
+    if scopes:
+        for scope, bots in scopes.items():
+            for qq in bots:
+                manager.add_bot(qq, scope)
+    gate = prefilter.MonitorFilter()
+    gate.rebuild(args.enabled_groups or (), manager.scopes)
+    monitor_everyone = scopes is None
+
+    bot = MockBot()
+    recall_queue.start()
+    senders: Dict[int, int] = {}  # message_id -> user_id, to resolve replies
+    latencies: List[float] = []
+    events = 0
+    if args.trace_memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    with open(args.events, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            payload = json.loads(line)
+            if payload.get("post_type") != "message" or payload.get("message_type") != "group":
+                continue
+            events += 1
+            t0 = time.perf_counter()
+            group_id = int(payload["group_id"])
+            sender_id = int(payload["user_id"])
+            message_id = int(payload["message_id"])
+            senders[message_id] = sender_id
+            if monitor_everyone or gate.matches(group_id, sender_id):
+                at_targets, reply_id, text = parse_segments(payload.get("message"))
+                reply = payload.get("reply")
+                if reply and reply.get("sender"):
+                    reply_sender = int(reply["sender"]["user_id"])
+                else:
+                    reply_sender = senders.get(reply_id) if reply_id is not None else None
+                is_bot = (lambda qq: True) if monitor_everyone else (lambda qq: manager.is_bot(qq, group_id))
+                targets = detector_module.collect_targets(sender_id, reply_sender, at_targets, is_bot)
+                await detector.process(bot, group_id, sender_id, message_id, targets, float(payload["time"]), text)
+            latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    await detector.notices.flush()
+    await recall_queue.join()
+    await recall_queue.stop()
+
+    if args.trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        peak_text = f"{peak / 1048576:.1f} MiB (Python heap, tracemalloc)"
+    else:
+        peak_text = _peak_rss_text()
+
+    latencies.sort()
+    api_counts: Dict[str, int] = {}
+    for api, _ in bot.calls:
+        api_counts[api] = api_counts.get(api, 0) + 1
+
+    out = sys.stdout
+    print(f"events         : {events}", file=out)
+    print(f"elapsed        : {elapsed:.3f} s", file=out)
+    print(f"throughput     : {events / elapsed if elapsed else 0:,.0f} events/s", file=out)
+    print(f"latency p50    : {percentile(latencies, 0.5) * 1e6:.1f} µs", file=out)
+    print(f"latency p99    : {percentile(latencies, 0.99) * 1e6:.1f} µs", file=out)
+    print(f"peak memory    : {peak_text}", file=out)
+    print(f"api calls      : {api_counts}", file=out)
+    print(f"decisions      : {len(decisions)}", file=out)
+
+    if args.decisions:
+        with open(args.decisions, "w", encoding="utf-8") as f:
+            for d in decisions:
+                f.write(json.dumps(d._asdict(), ensure_ascii=False) + "\n")
+    else:
+        for d in decisions:
+            status = "banned" if d.banned else "failed"
+            print(f"  t={d.timestamp:.0f} group={d.group_id} bot={d.offender} {d.kind} {status}: {d.reason}", file=out)
+    await state.close()
+    return 0
+
+
+def generate(args) -> int:
+    """Synthetic traffic: every group has ``bots`` monitored bots plus humans.
+
+    Each group runs one pattern at a time (quiet chatter, a two-bot @ loop, a
+    ring of three or more bots, one bot spamming, or one bot echoing the same
+    text), switching at random.
+    """
+    rng = random.Random(args.seed)
+    groups = [100000000 + g for g in range(args.groups)]
+    group_bots = {g: [2000000000 + i * 100 + b for b in range(args.bots)] for i, g in enumerate(groups)}
+    patterns = [p.strip() for p in args.patterns.split(",") if p.strip()]
+    state: Dict[int, Tuple[str, int]] = {}
+    message_id = 1
+    now = float(args.start)
+    step = 1.0 / args.rate
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for _ in range(args.events):
+            now += step
+            group_id = rng.choice(groups)
+            bots = group_bots[group_id]
+            pattern, cursor = state.get(group_id, ("quiet", 0))
+            if rng.random() < 0.01:
+                pattern, cursor = rng.choice(patterns), 0
+            message: List[Dict[str, Any]] = [{"type": "text", "data": {"text": f"msg {message_id}"}}]
+
+            if rng.random() < args.human_ratio or len(bots) < 2:
+                sender = rng.randrange(10000, 1000000000)
+            elif pattern == "loop":
+                sender = bots[cursor % 2]
+                message.insert(0, {"type": "at", "data": {"qq": str(bots[(cursor + 1) % 2])}})
+            elif pattern == "ring":
+                size = min(3, len(bots))
+                sender = bots[cursor % size]
+                message.insert(0, {"type": "at", "data": {"qq": str(bots[(cursor + 1) % size])}})
+            elif pattern == "spam":
+                sender = bots[0]
+            elif pattern == "echo":
+                # Stuck bot repeating itself: same text, only a counter changes
+                sender = bots[0]
+                message = [{"type": "text", "data": {"text": f"收到，正在处理你的请求（{cursor % 3}）"}}]
+            else:
+                sender = rng.choice(bots)
+            state[group_id] = (pattern, cursor + 1)
+
+            out.write(json.dumps({
+                "post_type": "message",
+                "message_type": "group",
+                "sub_type": "normal",
+                "time": int(now),
+                "self_id": 10000,
+                "group_id": group_id,
+                "user_id": sender,
+                "message_id": message_id,
+                "message": message,
+                "raw_message": "",
+                "font": 0,
+                "sender": {"user_id": sender},
+            }) + "\n")
+            message_id += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.output:
+        bots_path = Path(f"{args.output}.bots.json")
+        bots_path.write_text(json.dumps({"bots": sorted(qq for bots in group_bots.values() for qq in bots)}), encoding="utf-8")
+        print(f"wrote {args.events} events to {args.output}, monitored bots to {bots_path}", file=sys.stderr)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0] if __doc__ else None)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="replay a JSONL event file")
+    run.add_argument("events")
+    run.add_argument("--bots", help="comma-separated monitored QQ numbers")
+    run.add_argument("--bots-file", help="bots.json-style monitored list")
+    run.add_argument("--enabled-groups", type=lambda v: [int(g) for g in v.split(",")], default=None)
+    run.add_argument("--history-window", type=float, default=240)
+    run.add_argument("--detection-window", type=float, default=30)
+    run.add_argument("--interaction-threshold", type=int, default=2)
+    run.add_argument("--spam-threshold", type=int, default=5)
+    run.add_argument("--ban-duration", type=int, default=600)
+    run.add_argument("--cycle-half-life", type=float, default=0)
+    run.add_argument("--cycle-min-weight", type=float, default=0.5)
+    run.add_argument("--cycle-max-length", type=int, default=5)
+    run.add_argument("--backend", default="memory", help="memory or sqlite")
+    run.add_argument("--backend-url", default="", help="sqlite file for --backend sqlite")
+    run.add_argument("--trace-memory", action="store_true", help="measure peak heap with tracemalloc (slower)")
+    run.add_argument("--decisions", help="write decisions as JSONL here instead of printing them")
+    run.add_argument("--verbose", action="store_true", help="keep the plugin's log output")
+
+    gen = sub.add_parser("generate", help="write synthetic events")
+    gen.add_argument("--groups", type=int, default=100)
+    gen.add_argument("--bots", type=int, default=4, help="monitored bots per group")
+    gen.add_argument("--events", type=int, default=100000)
+    gen.add_argument("--rate", type=float, default=200, help="events per second of simulated time")
+    gen.add_argument("--human-ratio", type=float, default=0.9)
+    gen.add_argument("--patterns", default="quiet,loop,ring,spam,echo")
+    gen.add_argument("--start", type=float, default=1700000000)
+    gen.add_argument("--seed", type=int, default=0)
+    gen.add_argument("-o", "--output")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        return generate(args)
+    return asyncio.run(replay(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
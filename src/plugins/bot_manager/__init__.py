@@ -1,46 +1,69 @@
 import os
-import json
 import asyncio
-from nonebot import on_command, on_message, get_driver
-from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message, MessageSegment
+import functools
+import signal
+from nonebot import on_command, on_message, on_notice, get_bots, get_driver
+from nonebot.adapters.onebot.v11 import Bot, GroupAdminNoticeEvent, GroupMessageEvent, Message, MessageSegment
+from nonebot.compat import model_dump
 from nonebot.params import CommandArg
 from nonebot.permission import SUPERUSER
+from nonebot.rule import Rule
 from nonebot.log import logger
 import time
-from typing import Dict, List, Tuple, Set
-from collections import defaultdict
-
-from .data_manager import bot_manager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import updater
+from .accounts import AccountRegistry
+from .baseline import OVERRIDE_KEYS, BaselineTracker
+from .config import ConfigWatcher, ReloadableConfig, config_changes, parse_groups, parse_value, validate_config
+from .data_manager import BotManager
+from .dedup import DedupIndex
+from .detector import DetectionSettings, Detector, collect_targets
+from .fingerprint import FingerprintWindow
+from .graph import InteractionGraph
+from .message_view import message_view
+from .metrics import metrics
+from .moderation import RecallQueue
+from .notices import NoticeScheduler
+from .offenders import OFFENDER_FILE, OffenderIndex
+from .permissions import PermissionCache
+from .prefilter import MonitorFilter
+from .sharding import ShardedDispatcher
+from .snapshot import SNAPSHOT_FILE, SnapshotFile
+from .state import MemoryDetectionState, create_detection_state
+from .storage import GLOBAL_SCOPE, create_storage
 
 # --- Configuration Loading ---
 config = get_driver().config
 ENABLED_GROUPS: Set[int] = set()
 enabled_groups_config = getattr(config, "enabled_groups", [])
 
-if isinstance(enabled_groups_config, str):
-    try:
-        loaded = json.loads(enabled_groups_config)
-        if isinstance(loaded, list):
-            enabled_groups_config = loaded
-        else:
-            enabled_groups_config = [loaded]
-    except json.JSONDecodeError:
-        # If not JSON, try comma separated
-        if "," in enabled_groups_config:
-             enabled_groups_config = [g.strip() for g in enabled_groups_config.split(",")]
-        else:
-             # Single value or empty
-             enabled_groups_config = [enabled_groups_config] if enabled_groups_config else []
-
-if enabled_groups_config:
-    try:
-        # Ensure it's iterable
-        if not isinstance(enabled_groups_config, (list, tuple, set)):
-             enabled_groups_config = [enabled_groups_config]
-             
-        ENABLED_GROUPS = set(int(g) for g in enabled_groups_config)
-    except (ValueError, TypeError):
-        logger.error(f"Invalid format for ENABLED_GROUPS: {enabled_groups_config}")
+try:
+    ENABLED_GROUPS = parse_groups(enabled_groups_config)
+except (ValueError, TypeError):
+    logger.error(f"Invalid format for ENABLED_GROUPS: {enabled_groups_config}")
+
+# Monitored bot list: storage backend (json/sqlite/memory), optional file path,
+# and whether commands edit the global list or the current group's list
+BOT_STORAGE = getattr(config, "bot_storage", "json")
+BOT_STORAGE_PATH = getattr(config, "bot_storage_path", "")
+BOT_SCOPE = str(getattr(config, "bot_scope", "global")).lower()
+
+bot_manager = BotManager(create_storage(BOT_STORAGE, BOT_STORAGE_PATH))
+
+# Sender/group gate for the monitor matcher, rebuilt when the lists change
+monitor_filter = MonitorFilter()
+
+def rebuild_monitor_filter():
+    monitor_filter.rebuild(ENABLED_GROUPS, bot_manager.scopes)
+
+bot_manager.listeners.append(rebuild_monitor_filter)
+rebuild_monitor_filter()
+
+def command_scope(group_id: int) -> int:
+    """Scope that /add_bot and /del_bot act on in the given group."""
+    return group_id if BOT_SCOPE == "group" else GLOBAL_SCOPE
 
 def is_group_enabled(group_id: int) -> bool:
     """Check if the feature is enabled for the given group."""
@@ -53,81 +76,45 @@ def is_group_enabled(group_id: int) -> bool:
 add_bot_cmd = on_command("add_bot", permission=SUPERUSER, priority=10, block=True)
 del_bot_cmd = on_command("del_bot", permission=SUPERUSER, priority=10, block=True)
 list_bots_cmd = on_command("list_bots", permission=SUPERUSER, priority=10, block=True)
+bot_stats_cmd = on_command("bot_stats", permission=SUPERUSER, priority=10, block=True)
+bot_threshold_cmd = on_command("bot_threshold", permission=SUPERUSER, priority=10, block=True)
+reload_cmd = on_command("reload", permission=SUPERUSER, priority=10, block=True)
+set_threshold_cmd = on_command("set_threshold", permission=SUPERUSER, priority=10, block=True)
 update_cmd = on_command("update", permission=SUPERUSER, priority=10, block=True)
 
 @update_cmd.handle()
 async def handle_update():
     await update_cmd.send("正在检查更新...")
     try:
-        # Check if git is available
-        proc = await asyncio.create_subprocess_shell(
-            "git --version",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        await proc.communicate()
-        if proc.returncode != 0:
-            await update_cmd.finish("未找到 git 命令，无法自动更新。")
-            return
-
-        # Stash local changes to prevent overwrite errors
-        proc = await asyncio.create_subprocess_shell(
-            "git stash",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout_stash, _ = await proc.communicate()
-        stash_output = stdout_stash.decode('utf-8', errors='replace')
-        was_stashed = "Saved working directory" in stash_output
-
-        # Pull changes
-        # Use subprocess to run git pull
-        proc = await asyncio.create_subprocess_shell(
-            "git pull",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await proc.communicate()
-        pull_returncode = proc.returncode
-        
-        output = stdout.decode('utf-8', errors='replace').strip()
-        pull_error = stderr.decode('utf-8', errors='replace').strip()
-        
-        # Restore local changes if they were stashed
-        pop_error = None
-        if was_stashed:
-            proc_pop = await asyncio.create_subprocess_shell(
-                "git stash pop",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout_pop, stderr_pop = await proc_pop.communicate()
-            if proc_pop.returncode != 0:
-                pop_output = stdout_pop.decode('utf-8', errors='replace').strip()
-                pop_err = stderr_pop.decode('utf-8', errors='replace').strip()
-                pop_error = f"{pop_output}\n{pop_err}".strip()
-
-        if pull_returncode != 0:
-            # If git fails, it usually won't touch files, so .env and bots.json are safe.
-            msg = f"更新失败:\n{pull_error}"
-            if pop_error:
-                msg += f"\n\n此外，恢复本地更改时也发生了错误:\n{pop_error}"
-            await update_cmd.finish(msg)
-            return
-            
-        if pop_error:
-            await update_cmd.finish(f"更新成功，但在恢复本地更改时发生冲突:\n{pop_error}\n请手动解决冲突。")
-            return
-            
-        if "Already up to date" in output or "已经是最新" in output:
-            await update_cmd.finish("当前已是最新版本。")
-            return
-            
-        await update_cmd.send(f"更新成功:\n{output}\n注意：.env 和 bots.json 不会被覆盖。\n请手动重启机器人以应用更改。")
-        
+        result = await updater.update(Path.cwd())
     except Exception as e:
         logger.error(f"Update failed: {e}")
         await update_cmd.finish(f"更新过程中发生错误: {e}")
+        return
+
+    if result.status == updater.FAILED:
+        # If git fails, it usually won't touch files, so .env and bots.json are safe.
+        await update_cmd.finish(f"更新失败:\n{result.output}")
+        return
+    if result.status == updater.INVALID:
+        await update_cmd.finish(f"新版本无法加载，已回退到当前版本:\n{result.output[-1500:]}")
+        return
+    if result.status == updater.UP_TO_DATE:
+        await update_cmd.finish("当前已是最新版本。")
+        return
+    if result.status == updater.CONFLICT:
+        await update_cmd.finish(f"更新成功，但在恢复本地更改时发生冲突:\n{result.output}\n请手动解决冲突。")
+        return
+
+    if not updater.is_supervised():
+        await update_cmd.finish(f"更新成功:\n{result.output}\n注意：.env 和 bots.json 不会被覆盖。\n请手动重启机器人以应用更改。")
+        return
+
+    # The supervisor starts the new version as soon as this process exits;
+    # shutdown hooks save the detection snapshot it resumes from
+    logger.info(f"Updated {result.old_rev[:8]} -> {result.new_rev[:8]}, restarting")
+    asyncio.get_running_loop().call_later(1.0, signal.raise_signal, signal.SIGINT)
+    await update_cmd.finish(f"更新成功:\n{result.output}\n正在重启以应用更改，检测状态会自动恢复。")
 
 @add_bot_cmd.handle()
 async def handle_add_bot(event: GroupMessageEvent, args: Message = CommandArg()):
@@ -135,11 +122,7 @@ async def handle_add_bot(event: GroupMessageEvent, args: Message = CommandArg())
         return
 
     # Check for mentions first
-    at_users = [
-        int(seg.data["qq"]) 
-        for seg in event.message 
-        if seg.type == "at" and seg.data.get("qq") != "all"
-    ]
+    at_users = list(message_view(event).mentions)
     
     # Check for plain text argument if no mentions
     if not at_users:
@@ -153,7 +136,7 @@ async def handle_add_bot(event: GroupMessageEvent, args: Message = CommandArg())
 
     added_bots = []
     for qq in at_users:
-        if bot_manager.add_bot(qq):
+        if bot_manager.add_bot(qq, command_scope(event.group_id)):
             added_bots.append(str(qq))
     
     if added_bots:
@@ -167,11 +150,7 @@ async def handle_del_bot(event: GroupMessageEvent, args: Message = CommandArg())
         return
 
     # Check for mentions first
-    at_users = [
-        int(seg.data["qq"]) 
-        for seg in event.message 
-        if seg.type == "at" and seg.data.get("qq") != "all"
-    ]
+    at_users = list(message_view(event).mentions)
     
     # Check for plain text argument if no mentions
     if not at_users:
@@ -185,7 +164,7 @@ async def handle_del_bot(event: GroupMessageEvent, args: Message = CommandArg())
 
     removed_bots = []
     for qq in at_users:
-        if bot_manager.remove_bot(qq):
+        if bot_manager.remove_bot(qq, command_scope(event.group_id)):
             removed_bots.append(str(qq))
             
     if removed_bots:
@@ -198,7 +177,7 @@ async def handle_list_bots(event: GroupMessageEvent):
     if not is_group_enabled(event.group_id):
         return
 
-    bots = bot_manager.get_bots()
+    bots = bot_manager.get_bots(event.group_id)
     if bots:
         msg = "当前监控的机器人:\n" + "\n".join(str(qq) for qq in bots)
         await list_bots_cmd.finish(msg)
@@ -208,113 +187,534 @@ async def handle_list_bots(event: GroupMessageEvent):
 
 # --- Loop Detection Logic ---
 
-# Store interaction history: { group_id: [ (sender_id, target_id, timestamp, message_id) ] }
-interaction_history: Dict[int, List[Tuple[int, int, float, int]]] = defaultdict(list)
-
 # Configuration
 HISTORY_WINDOW = getattr(config, "history_window", 240)
 DETECTION_WINDOW = getattr(config, "detection_window", 30)
 INTERACTION_THRESHOLD = getattr(config, "interaction_threshold", 2)
 SPAM_THRESHOLD = getattr(config, "spam_threshold", 5)
 BAN_DURATION = getattr(config, "ban_duration", 600)
+# Repeat offenders: each prior offense multiplies the ban, up to the cap
+# (seconds); prior offenses count half as much after each half-life
+BAN_MULTIPLIER = getattr(config, "ban_multiplier", 2.0)
+BAN_MAX_DURATION = getattr(config, "ban_max_duration", 86400)
+OFFENSE_HALF_LIFE = getattr(config, "offense_half_life", 3600)
+# Reaper cadence (seconds) and max sender windows visited per slice
+REAPER_INTERVAL = getattr(config, "reaper_interval", 60)
+REAPER_BATCH = getattr(config, "reaper_batch", 500)
+# Recall queue: per-account rate (recalls/second), burst size, workers, retries
+RECALL_RATE = getattr(config, "recall_rate", 2)
+RECALL_BURST = getattr(config, "recall_burst", 3)
+RECALL_WORKERS = getattr(config, "recall_workers", 2)
+RECALL_MAX_RETRIES = getattr(config, "recall_max_retries", 3)
+RECALL_RETRY_DELAY = getattr(config, "recall_retry_delay", 1.0)
+# Concurrent recalls per ban, and an optional batch-recall action name for
+# OneBot implementations that offer one (falls back to delete_msg if missing)
+RECALL_CONCURRENCY = getattr(config, "recall_concurrency", 3)
+RECALL_BATCH_API = getattr(config, "recall_batch_api", "")
+# Cycle detection: edge weight half-life (seconds), weight an edge needs to
+# count as active, and the longest loop (in bots) that is searched for. By
+# default one round of a ring of three or more bots within a few windows is
+# enough, so rings too slow for the per-sender interaction threshold are still
+# caught; two bots answering each other are left to that threshold. Unless
+# set, the half-life follows the detection window, also when that changes
+CYCLE_HALF_LIFE_WINDOWS = 4
+CYCLE_HALF_LIFE = getattr(config, "cycle_half_life", DETECTION_WINDOW * CYCLE_HALF_LIFE_WINDOWS)
+CYCLE_MIN_WEIGHT = getattr(config, "cycle_min_weight", 0.5)
+CYCLE_MAX_LENGTH = getattr(config, "cycle_max_length", 5)
+# Near-duplicate text: spam threshold multiplier, fingerprints kept per bot,
+# and max SimHash bit difference that still counts as a duplicate
+DUPLICATE_SPAM_FACTOR = getattr(config, "duplicate_spam_factor", 0.6)
+FINGERPRINT_SIZE = getattr(config, "fingerprint_size", 16)
+FINGERPRINT_DISTANCE = getattr(config, "fingerprint_distance", 8)
+# Per-group thresholds learned from each bot's normal traffic (off by default):
+# EWMA smoothing, standard deviations above the mean that count as a flood,
+# buckets of history needed first, and the range learned spam thresholds stay in
+ADAPTIVE_THRESHOLDS = bool(getattr(config, "adaptive_thresholds", False))
+ADAPTIVE_ALPHA = getattr(config, "adaptive_alpha", 0.05)
+ADAPTIVE_SIGMAS = getattr(config, "adaptive_sigmas", 4.0)
+ADAPTIVE_WARMUP = getattr(config, "adaptive_warmup", 20)
+ADAPTIVE_MIN_SPAM = getattr(config, "adaptive_min_spam", 3)
+ADAPTIVE_MAX_SPAM = getattr(config, "adaptive_max_spam", SPAM_THRESHOLD * 4)
+BASELINE_PATH = getattr(config, "baseline_path", "") or "baselines.json"
+
+# Detection runs on per-group-shard workers: shard count, queued messages per
+# shard, and what to do when a shard is full (drop_oldest, drop_newest, or
+# block: hold the handler up to SHARD_BLOCK_TIMEOUT seconds, then drop)
+SHARD_COUNT = getattr(config, "shard_count", 8)
+SHARD_QUEUE_SIZE = getattr(config, "shard_queue_size", 256)
+SHARD_POLICY = str(getattr(config, "shard_policy", "drop_oldest")).lower()
+SHARD_BLOCK_TIMEOUT = getattr(config, "shard_block_timeout", 1.0)
+
+# Ban announcements: seconds to gather notices into one message per group,
+# and messages/second allowed per group and across all groups
+NOTICE_WINDOW = getattr(config, "notice_window", 2.0)
+NOTICE_GROUP_RATE = getattr(config, "notice_group_rate", 0.2)
+NOTICE_GLOBAL_RATE = getattr(config, "notice_global_rate", 1.0)
+
+# Accounts: seconds between refreshes of each account's admin map, and
+# consecutive connection failures after which an account sits out for
+# ACCOUNT_COOLDOWN seconds
+ACCOUNT_REFRESH_INTERVAL = getattr(config, "account_refresh_interval", 600)
+ACCOUNT_UNHEALTHY_AFTER = getattr(config, "account_unhealthy_after", 3)
+ACCOUNT_COOLDOWN = getattr(config, "account_cooldown", 60)
+# Seconds group roles are cached for; bans that can't work (our account isn't
+# admin, or the target is admin/owner) are skipped. 0 tries every ban as before
+PERMISSION_TTL = getattr(config, "permission_ttl", 600)
+
+# Messages already processed, so reconnect replays and copies delivered to
+# several of our accounts are only counted once: seconds kept, max entries
+DEDUP_TTL = getattr(config, "dedup_ttl", 600)
+DEDUP_MAX_ENTRIES = getattr(config, "dedup_max_entries", 65536)
+
+# Where windows and punishment markers live: memory (this process only), or
+# sqlite/redis to share them between several bot processes
+DETECTION_BACKEND = getattr(config, "detection_backend", "memory")
+DETECTION_BACKEND_URL = getattr(config, "detection_backend_url", "")
+# Snapshots of the in-memory detection state: seconds between periodic
+# snapshots (0 turns snapshots off), file path, and max seconds spent restoring
+SNAPSHOT_INTERVAL = getattr(config, "snapshot_interval", 60)
+SNAPSHOT_PATH = getattr(config, "snapshot_path", "") or str(SNAPSHOT_FILE)
+SNAPSHOT_RESTORE_BUDGET = getattr(config, "snapshot_restore_budget", 2.0)
+
+# Per-(group, sender) message/interaction windows, and offenders with a ban
+# in flight or still serving one
+detection_state = create_detection_state(
+    DETECTION_BACKEND,
+    DETECTION_BACKEND_URL,
+    DETECTION_WINDOW,
+    HISTORY_WINDOW,
+    BAN_DURATION,
+)
+
+# sqlite/redis state already outlives the process; only memory needs snapshots
+snapshots: Optional[SnapshotFile] = None
+if SNAPSHOT_INTERVAL > 0 and isinstance(detection_state, MemoryDetectionState):
+    snapshots = SnapshotFile(Path(SNAPSHOT_PATH), detection_state.window, detection_state.punishments)
+
+recall_queue = RecallQueue(
+    rate=RECALL_RATE,
+    burst=RECALL_BURST,
+    workers=RECALL_WORKERS,
+    max_retries=RECALL_MAX_RETRIES,
+    retry_delay=RECALL_RETRY_DELAY,
+    concurrency=RECALL_CONCURRENCY,
+    batch_api=RECALL_BATCH_API,
+)
+
+# Who @s/replies to whom, per group, for A -> B -> C -> A loops
+interaction_graph = InteractionGraph(CYCLE_HALF_LIFE, CYCLE_MIN_WEIGHT, CYCLE_MAX_LENGTH)
+
+baselines = BaselineTracker(
+    DETECTION_WINDOW,
+    alpha=ADAPTIVE_ALPHA,
+    sigmas=ADAPTIVE_SIGMAS,
+    warmup=ADAPTIVE_WARMUP,
+    floor=ADAPTIVE_MIN_SPAM,
+    ceiling=ADAPTIVE_MAX_SPAM,
+    adaptive=ADAPTIVE_THRESHOLDS,
+    path=Path(BASELINE_PATH),
+)
+
+# Offense history sits next to the bot list file
+offender_index = OffenderIndex(
+    OFFENSE_HALF_LIFE,
+    (Path(BOT_STORAGE_PATH).parent if BOT_STORAGE_PATH else Path(".")) / OFFENDER_FILE.name,
+)
+
+notice_scheduler = NoticeScheduler(
+    window=NOTICE_WINDOW,
+    group_rate=NOTICE_GROUP_RATE,
+    global_rate=NOTICE_GLOBAL_RATE,
+    # Bans and recalls in flight go out before announcements
+    busy=lambda: detection.bans_in_flight > 0 or recall_queue.pending() > 0,
+)
+
+# Roles are looked up as bans need them; member lists are only loaded, on
+# connect, for groups with offenders in the last PERMISSION_WARM_WINDOW seconds
+permission_cache = PermissionCache(PERMISSION_TTL) if PERMISSION_TTL > 0 else None
+PERMISSION_WARM_WINDOW = 24 * 3600
+
+detection = Detector(
+    detection_state,
+    interaction_graph,
+    recall_queue,
+    DetectionSettings(
+        history_window=HISTORY_WINDOW,
+        detection_window=DETECTION_WINDOW,
+        interaction_threshold=INTERACTION_THRESHOLD,
+        spam_threshold=SPAM_THRESHOLD,
+        ban_duration=BAN_DURATION,
+        duplicate_factor=DUPLICATE_SPAM_FACTOR,
+        ban_multiplier=BAN_MULTIPLIER,
+        ban_max_duration=BAN_MAX_DURATION,
+    ),
+    FingerprintWindow(DETECTION_WINDOW, FINGERPRINT_SIZE, FINGERPRINT_DISTANCE),
+    baselines,
+    offender_index,
+    notice_scheduler,
+    permission_cache,
+)
+
+# Every connected OneBot V11 account; moderation goes through the best one
+account_registry = AccountRegistry(
+    lambda: {self_id: b for self_id, b in get_bots().items() if isinstance(b, Bot)},
+    ACCOUNT_UNHEALTHY_AFTER,
+    ACCOUNT_COOLDOWN,
+    permission_cache,
+)
+
+dedup_index = DedupIndex(DEDUP_TTL, DEDUP_MAX_ENTRIES)
+
+dispatcher = ShardedDispatcher(SHARD_COUNT, SHARD_QUEUE_SIZE, SHARD_POLICY, SHARD_BLOCK_TIMEOUT)
+
+# --- Runtime configuration ---
+
+# How often (seconds) the .env files are checked for changes; 0 turns it off
+CONFIG_WATCH_INTERVAL = getattr(config, "config_watch_interval", 5)
+
+try:
+    current_config = validate_config({
+        "enabled_groups": ENABLED_GROUPS,
+        "history_window": HISTORY_WINDOW,
+        "detection_window": DETECTION_WINDOW,
+        "interaction_threshold": INTERACTION_THRESHOLD,
+        "spam_threshold": SPAM_THRESHOLD,
+        "ban_duration": BAN_DURATION,
+        "ban_multiplier": BAN_MULTIPLIER,
+        "ban_max_duration": BAN_MAX_DURATION,
+        "duplicate_spam_factor": DUPLICATE_SPAM_FACTOR,
+    })
+except Exception as e:
+    logger.error(f"Invalid detection settings: {e}")
+    current_config = ReloadableConfig()
+
+async def apply_config(values: Dict[str, Any]) -> List[Tuple[str, Any, Any]]:
+    """Validate ``values`` on top of the running settings and swap them in.
+
+    Raises if the result does not validate; nothing is changed in that case.
+    Returns the settings that changed.
+    """
+    global ENABLED_GROUPS, current_config
+    new_config = validate_config({**model_dump(current_config), **values})
+    changes = config_changes(current_config, new_config)
+    if not changes:
+        return changes
+
+    # No await from here on, so handlers see either the old or the new settings
+    detection.update_settings(detection.settings._replace(
+        history_window=new_config.history_window,
+        detection_window=new_config.detection_window,
+        interaction_threshold=new_config.interaction_threshold,
+        spam_threshold=new_config.spam_threshold,
+        ban_duration=new_config.ban_duration,
+        ban_multiplier=new_config.ban_multiplier,
+        ban_max_duration=new_config.ban_max_duration,
+        duplicate_factor=new_config.duplicate_spam_factor,
+    ))
+    if not hasattr(config, "cycle_half_life"):
+        interaction_graph.set_half_life(new_config.detection_window * CYCLE_HALF_LIFE_WINDOWS)
+    ENABLED_GROUPS = set(new_config.enabled_groups)
+    current_config = new_config
+    rebuild_monitor_filter()
+    logger.info("Config reloaded: " + ", ".join(f"{key}={new}" for key, _, new in changes))
+    return changes
+
+config_watcher = ConfigWatcher(
+    [Path(".env"), Path(f".env.{getattr(config, 'environment', 'prod')}")],
+    apply_config,
+    CONFIG_WATCH_INTERVAL,
+)
+
+_reaper_task: Optional[asyncio.Task] = None
+_config_task: Optional[asyncio.Task] = None
+_snapshot_task: Optional[asyncio.Task] = None
+_accounts_task: Optional[asyncio.Task] = None
+# Per-connection account refreshes; the loop only holds tasks weakly
+_connect_tasks: Set[asyncio.Task] = set()
+
+async def _reap_history():
+    """Periodically expire history in groups that have gone quiet."""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL)
+        try:
+            # Work through all groups in bounded slices, yielding in between
+            while not await detection_state.sweep(time.time(), REAPER_BATCH):
+                await asyncio.sleep(0)
+            detection.sweep(time.time())
+        except Exception as e:
+            logger.error(f"History reaper failed: {e}")
+
+async def _save_snapshots(snapshot_file: SnapshotFile):
+    """Periodically snapshot the detection state so a restart resumes where it left off."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await snapshot_file.save(time.time())
+        except Exception as e:
+            logger.error(f"Saving detection snapshot failed: {e}")
 
-monitor_handler = on_message(priority=5, block=False)
+async def _restore_snapshot(snapshot_file: SnapshotFile):
+    try:
+        stats = await snapshot_file.load(time.time(), SNAPSHOT_RESTORE_BUDGET)
+    except Exception as e:
+        logger.error(f"Restoring detection snapshot failed: {e}")
+        return
+    if stats:
+        logger.info(f"Restored detection snapshot: {stats}")
+
+async def _refresh_accounts():
+    """Periodically re-read where each account has admin rights."""
+    while True:
+        await asyncio.sleep(ACCOUNT_REFRESH_INTERVAL)
+        await account_registry.refresh_all(is_group_enabled)
+
+async def _refresh_account(bot: Bot):
+    try:
+        await account_registry.refresh(bot, is_group_enabled)
+    except Exception as e:
+        logger.error(f"Refreshing admin map for {bot.self_id} failed: {e}")
+    if permission_cache is not None:
+        now = time.time()
+        recent = offender_index.groups(now - PERMISSION_WARM_WINDOW)
+        await permission_cache.warm(bot, sorted(g for g in recent if is_group_enabled(g)), now)
+
+@get_driver().on_bot_connect
+async def _on_bot_connect(bot: Bot):
+    # In the background, so the connection isn't held up by the lookups
+    task = asyncio.create_task(_refresh_account(bot))
+    _connect_tasks.add(task)
+    task.add_done_callback(_connect_tasks.discard)
+
+@get_driver().on_bot_disconnect
+async def _on_bot_disconnect(bot: Bot):
+    account_registry.forget(bot.self_id)
+
+@get_driver().on_startup
+async def _start_background_tasks():
+    global _reaper_task, _config_task, _snapshot_task, _accounts_task
+    if snapshots:
+        await _restore_snapshot(snapshots)
+        _snapshot_task = asyncio.create_task(_save_snapshots(snapshots))
+    _reaper_task = asyncio.create_task(_reap_history())
+    dispatcher.start()
+    if ACCOUNT_REFRESH_INTERVAL > 0:
+        _accounts_task = asyncio.create_task(_refresh_accounts())
+    if CONFIG_WATCH_INTERVAL > 0:
+        _config_task = asyncio.create_task(config_watcher.run())
+    recall_queue.start()
+
+@get_driver().on_shutdown
+async def _stop_background_tasks():
+    if _reaper_task:
+        _reaper_task.cancel()
+    if _config_task:
+        _config_task.cancel()
+    if _snapshot_task:
+        _snapshot_task.cancel()
+    if _accounts_task:
+        _accounts_task.cancel()
+    for task in list(_connect_tasks):
+        task.cancel()
+    await dispatcher.stop()
+    await notice_scheduler.flush()
+    await recall_queue.stop()
+    if snapshots:
+        try:
+            await snapshots.save(time.time())
+        except Exception as e:
+            logger.error(f"Saving detection snapshot failed: {e}")
+    await bot_manager.flush()
+    await baselines.flush()
+    await offender_index.flush()
+    await detection_state.close()
+
+async def _is_monitored_sender(event: GroupMessageEvent) -> bool:
+    # Checked before the handler's dependencies are resolved, so messages from
+    # humans (almost all traffic) stop here. Not timed: that would cost more
+    # than the check (see benchmarks/prefilter_overhead.py)
+    return monitor_filter.matches(event.group_id, event.user_id)
+
+monitor_handler = on_message(rule=Rule(_is_monitored_sender), priority=5, block=False)
 
 @monitor_handler.handle()
 async def handle_monitor(bot: Bot, event: GroupMessageEvent):
-    sender_id = event.user_id
-    group_id = event.group_id
-    message_id = event.message_id
+    # 0/1. Group is enabled and sender is a monitored bot: see _is_monitored_sender
 
-    # 0. Check if group is enabled
-    if not is_group_enabled(group_id):
+    # Seen already: replayed after a reconnect, or delivered to several of our
+    # accounts. Checked before anything is recorded.
+    if not dedup_index.first_seen(event.group_id, event.message_id, time.time()):
         return
 
-    # 1. Check if sender is a monitored bot
-    if not bot_manager.is_bot(sender_id):
+    # 2. Check if message mentions another monitored bot OR replies to a monitored bot
+    view = message_view(event)
+    mentioned_bots = collect_targets(
+        event.user_id,
+        view.reply_to,
+        view.mentions,
+        lambda qq: bot_manager.is_bot(qq, event.group_id),
+    )
+
+    # 3. Detect on the group's shard, so a busy group doesn't hold up the others
+    await dispatcher.submit(event.group_id, functools.partial(
+        detection.process,
+        account_registry.route(event.group_id, bot),
+        event.group_id,
+        event.user_id,
+        event.message_id,
+        mentioned_bots,
+        time.time(),
+        view.plain_text,
+    ))
+
+admin_notice = on_notice(priority=5, block=False)
+
+@admin_notice.handle()
+async def handle_admin_change(event: GroupAdminNoticeEvent):
+    """Someone was made or unmade admin: update cached roles right away."""
+    if not is_group_enabled(event.group_id):
         return
+    account_registry.role_changed(event.group_id, event.user_id, "admin" if event.sub_type == "set" else "member")
 
-    # 2. Check if message mentions another monitored bot OR replies to a monitored bot
-    mentioned_bots = []
-    
-    # Check for reply
-    if event.reply:
-        reply_sender_id = event.reply.sender.user_id
-        if bot_manager.is_bot(reply_sender_id) and reply_sender_id != sender_id:
-            mentioned_bots.append(reply_sender_id)
-
-    # Check for @ mentions
-    for seg in event.message:
-        if seg.type == "at":
-            target_qq = seg.data.get("qq")
-            if target_qq and target_qq != "all" and str(target_qq).isdigit():
-                target_qq_int = int(target_qq)
-                if bot_manager.is_bot(target_qq_int) and target_qq_int != sender_id:
-                    # Avoid adding the same bot twice if replied and mentioned
-                    if target_qq_int not in mentioned_bots:
-                        mentioned_bots.append(target_qq_int)
-
-    current_time = time.time()
-    
-    # Add interactions to history
-    if mentioned_bots:
-        for target_id in mentioned_bots:
-            interaction_history[group_id].append((sender_id, target_id, current_time, message_id))
-            logger.info(f"Bot Interaction: {sender_id} -> {target_id} in Group {group_id}")
-    else:
-        # Record general activity for rate limiting
-        interaction_history[group_id].append((sender_id, 0, current_time, message_id))
 
-    # Clean up old history
-    interaction_history[group_id] = [
-        (s, t, ts, mid) for s, t, ts, mid in interaction_history[group_id]
-        if current_time - ts <= HISTORY_WINDOW
-    ]
+# --- Per-group thresholds ---
 
-    # Check for loop/spam
-    # 1. Interaction Limit: sender -> target interactions
-    recent_interactions = [
-        (s, t, ts, mid) for s, t, ts, mid in interaction_history[group_id]
-        if s == sender_id and t != 0 and current_time - ts <= DETECTION_WINDOW
-    ]
-    
-    # 2. Rate Limit: sender -> group message count
-    recent_messages = [
-        (s, t, ts, mid) for s, t, ts, mid in interaction_history[group_id]
-        if s == sender_id and current_time - ts <= DETECTION_WINDOW
+_THRESHOLD_ALIASES = {
+    "spam": "spam_threshold",
+    "interaction": "interaction_threshold",
+}
+
+@bot_threshold_cmd.handle()
+async def handle_bot_threshold(event: GroupMessageEvent, args: Message = CommandArg()):
+    """/bot_threshold [spam|interaction <n|reset> | reset] for the current group."""
+    if not is_group_enabled(event.group_id):
+        return
+
+    group_id = event.group_id
+    parts = args.extract_plain_text().split()
+    if parts == ["reset"]:
+        baselines.clear_overrides(group_id)
+        await bot_threshold_cmd.finish("已清除本群的阈值设置。")
+        return
+    if parts:
+        key = _THRESHOLD_ALIASES.get(parts[0], parts[0])
+        if key not in OVERRIDE_KEYS or len(parts) != 2 or not (parts[1].isdigit() or parts[1] == "reset"):
+            await bot_threshold_cmd.finish("用法: /bot_threshold [spam|interaction <数值|reset>] 或 /bot_threshold reset")
+            return
+        value = None if parts[1] == "reset" else int(parts[1])
+        if value is not None and value < 1:
+            await bot_threshold_cmd.finish("阈值必须大于 0。")
+            return
+        baselines.set_override(group_id, key, value)
+        await bot_threshold_cmd.finish(f"本群 {key} 已{'恢复默认' if value is None else f'设置为 {value}'}。")
+        return
+
+    settings = detection.settings
+    pinned = baselines.overrides.get(group_id, {})
+    lines = [
+        f"本群阈值（{settings.detection_window}秒内）：",
+        f"交互: {baselines.interaction_threshold(group_id, settings.interaction_threshold)}"
+        + ("（手动）" if "interaction_threshold" in pinned else ""),
+        f"刷屏: 默认 {baselines.spam_threshold(group_id, 0, settings.spam_threshold)}"
+        + ("（手动）" if "spam_threshold" in pinned else ""),
+        f"自适应阈值: {'开启' if baselines.adaptive else '关闭'}",
     ]
-    
-    reason = ""
-    messages_to_recall = []
-
-    if len(recent_interactions) >= INTERACTION_THRESHOLD:
-        reason = f"检测到互怼/频繁回复（{len(recent_interactions)}次交互/30秒）"
-        messages_to_recall = [mid for _, _, _, mid in recent_interactions]
-    elif len(recent_messages) >= SPAM_THRESHOLD:
-        reason = f"检测到刷屏（{len(recent_messages)}条消息/30秒）"
-        messages_to_recall = [mid for _, _, _, mid in recent_messages]
-
-    if reason:
-        logger.warning(f"Bot ban triggered: {reason}. Bot: {sender_id}, Group: {group_id}")
-        
-        # Mute the sender
-        try:
-            await bot.set_group_ban(
-                group_id=group_id,
-                user_id=sender_id,
-                duration=BAN_DURATION
-            )
-            await monitor_handler.send(f"{reason}，已禁言 {sender_id} {BAN_DURATION//60}分钟，并撤回相关消息。")
-            
-            # Recall messages
-            for mid in messages_to_recall:
-                try:
-                    await bot.delete_msg(message_id=mid)
-                    await asyncio.sleep(0.5) # Avoid rate limit
-                except Exception as e:
-                    logger.warning(f"Failed to recall message {mid}: {e}")
+    for bot_id, mean, stddev, samples in baselines.group_baselines(group_id):
+        learned = baselines.learned(group_id, bot_id)
+        lines.append(
+            f"{bot_id}: 均值 {mean:.2f} 标准差 {stddev:.2f}（{samples} 个窗口）"
+            f" 刷屏阈值 {baselines.spam_threshold(group_id, bot_id, settings.spam_threshold)}"
+            + ("" if learned is not None else "（学习中）")
+        )
+    await bot_threshold_cmd.finish("\n".join(lines))
 
-        except Exception as e:
-            logger.error(f"Failed to ban bot {sender_id}: {e}")
-            await monitor_handler.send(f"尝试禁言 {sender_id} 失败，请检查权限。")
 
+# --- Reload ---
+
+def _format_changes(changes: List[Tuple[str, Any, Any]]) -> str:
+    return "\n".join(f"{key}: {old} → {new}" for key, old, new in changes)
+
+@reload_cmd.handle()
+async def handle_reload():
+    try:
+        changes = await apply_config(config_watcher.read())
+    except Exception as e:
+        await reload_cmd.finish(f"配置无效，未应用任何更改:\n{e}")
+        return
+    if not changes:
+        await reload_cmd.finish("配置没有变化。")
+        return
+    await reload_cmd.finish(f"已重新加载配置:\n{_format_changes(changes)}")
+
+_SETTING_ALIASES = {
+    "spam": "spam_threshold",
+    "interaction": "interaction_threshold",
+    "ban": "ban_duration",
+    "window": "detection_window",
+    "history": "history_window",
+}
+
+@set_threshold_cmd.handle()
+async def handle_set_threshold(args: Message = CommandArg()):
+    """/set_threshold <setting> <value>: change a setting for every group until the next reload."""
+    parts = args.extract_plain_text().split(maxsplit=1)
+    if len(parts) != 2:
+        names = ", ".join(_SETTING_ALIASES)
+        await set_threshold_cmd.finish(f"用法: /set_threshold <设置项> <数值>\n可用的设置项: {names} 或配置项名称")
+        return
+
+    key = _SETTING_ALIASES.get(parts[0].lower(), parts[0].lower())
+    if key not in model_dump(current_config):
+        await set_threshold_cmd.finish(f"未知的设置项: {parts[0]}")
+        return
+    try:
+        changes = await apply_config({key: parse_value(parts[1])})
+    except Exception as e:
+        await set_threshold_cmd.finish(f"数值无效，未应用:\n{e}")
+        return
+    if not changes:
+        await set_threshold_cmd.finish("设置没有变化。")
+        return
+    await set_threshold_cmd.finish(f"已更新（若 .env 中也设置了该项，下次重新加载时以 .env 为准）:\n{_format_changes(changes)}")
+
+
+# --- Metrics ---
+
+metrics.gauge("recall_queue_pending", recall_queue.pending)
+metrics.gauge("tracked_groups", lambda: detection_state.stats().get("groups", 0))
+metrics.gauge("tracked_events", lambda: detection_state.stats().get("events", 0))
+metrics.gauge("shard_pending", dispatcher.pending)
+metrics.gauge("notices_pending", notice_scheduler.pending)
+metrics.gauge("dedup_entries", lambda: len(dedup_index))
+if permission_cache is not None:
+    metrics.gauge("permission_groups_cached", permission_cache.__len__)
+metrics.gauge_family("account_latency_ms", "account", account_registry.latencies)
+metrics.gauge_family("account_admin_groups", "account", account_registry.admin_counts)
+metrics.gauge_family("shard_queue_depth", "shard", dispatcher.depths)
+metrics.gauge_family("hot_group_pending", "group", dispatcher.hot_groups)
+
+@bot_stats_cmd.handle()
+async def handle_bot_stats():
+    await bot_stats_cmd.finish(metrics.summary())
+
+# Optional Prometheus scrape endpoint on the FastAPI driver, e.g. METRICS_PATH=/metrics
+METRICS_PATH = getattr(config, "metrics_path", "")
+
+def _add_metrics_endpoint(path: str) -> bool:
+    try:
+        from fastapi import FastAPI
+        from fastapi.responses import PlainTextResponse
+    except ImportError:
+        return False
+
+    server_app = getattr(get_driver(), "server_app", None)
+    if not isinstance(server_app, FastAPI):
+        return False
+
+    @server_app.get(path, response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics_endpoint():
+        return metrics.render_prometheus()
+
+    return True
+
+if METRICS_PATH and not _add_metrics_endpoint(METRICS_PATH):
+    logger.warning("METRICS_PATH is set but the driver is not FastAPI; endpoint disabled")
@@ -0,0 +1,228 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from nonebot.adapters.onebot.v11 import Bot
+from nonebot.exception import ActionFailed, ApiNotAvailable, NetworkError
+from nonebot.log import logger
+
+from .metrics import metrics
+from .permissions import PermissionCache
+
+# Errors that say something about the connection rather than the request
+_HEALTH_ERRORS = (NetworkError, ApiNotAvailable, asyncio.TimeoutError)
+
+# Calls that need group admin rights; everything else only needs membership
+_ADMIN_APIS = {"set_group_ban", "delete_msg", "delete_msgs", "batch_delete_msg"}
+
+
+class AccountHealth:
+    """Call latency (EWMA, seconds) and consecutive connection failures of one account."""
+
+    __slots__ = ("failures", "last_failure", "latency")
+
+    def __init__(self):
+        self.latency = 0.0
+        self.failures = 0
+        self.last_failure = 0.0
+
+    def record(self, seconds: float, ok: bool, alpha: float = 0.2):
+        self.latency = seconds if self.latency == 0 else self.latency + alpha * (seconds - self.latency)
+        if ok:
+            self.failures = 0
+        else:
+            self.failures += 1
+            self.last_failure = time.monotonic()
+
+
+class GroupRoute:
+    """Stands in for a Bot in one group, sending each call through the best account.
+
+    Bans go to the healthiest admin account in the group, and messages
+    prefer ``origin``, the account that received the event; both fail over
+    to other accounts. Recalls (any call carrying message ids) only go
+    through ``origin``, since the ids are only valid there: on another
+    account they mean nothing, or a different message.
+    """
+
+    def __init__(self, registry: "AccountRegistry", group_id: int, origin: Bot):
+        self.registry = registry
+        self.group_id = group_id
+        self.origin = origin
+
+    @property
+    def self_id(self) -> str:
+        # The account recalls go through, which is what callers key on
+        return self.origin.self_id
+
+    async def call_api(self, api: str, **data: Any) -> Any:
+        if "message_id" in data or "message_ids" in data:
+            return await self.origin.call_api(api, **data)
+        return await self.registry.call(self.group_id, self.origin, api, data, prefer_origin=True)
+
+    def ban_accounts(self) -> List[int]:
+        """The accounts ``set_group_ban`` may go through, as user ids."""
+        return [int(bot.self_id) for bot in self.registry.candidates(self.group_id, self.origin, True, False)]
+
+    async def set_group_ban(self, **data: Any) -> Any:
+        return await self.registry.call(self.group_id, self.origin, "set_group_ban", data, prefer_origin=False)
+
+    async def delete_msg(self, **data: Any) -> Any:
+        return await self.call_api("delete_msg", **data)
+
+    async def send_group_msg(self, **data: Any) -> Any:
+        return await self.call_api("send_group_msg", **data)
+
+
+# What moderation code is handed: a plain account, or a route through the best one
+ModerationBot = Union[Bot, GroupRoute]
+
+
+class AccountRegistry:
+    """Connected accounts, the groups each one is admin in, and how well each is doing.
+
+    ``get_bots`` returns the connected accounts by self_id (NoneBot's
+    ``get_bots``). The admin map is filled by ``refresh``; until an account
+    has been refreshed, it is only used for events it received itself, as
+    before. Accounts with ``unhealthy_after`` connection failures in a row
+    are skipped for ``cooldown`` seconds unless nothing else is left. With
+    ``permissions``, bans go first to accounts whose cached role lets them
+    mute the target, and the roles ``refresh`` reads are cached there too.
+    """
+
+    def __init__(
+        self,
+        get_bots: Callable[[], Dict[str, Bot]],
+        unhealthy_after: int = 3,
+        cooldown: float = 60,
+        permissions: Optional[PermissionCache] = None,
+    ):
+        self.get_bots = get_bots
+        self.unhealthy_after = unhealthy_after
+        self.cooldown = cooldown
+        self.permissions = permissions
+        self.admins: Dict[str, Set[int]] = {}
+        self.members: Dict[str, Set[int]] = {}
+        self.health: Dict[str, AccountHealth] = {}
+
+    def route(self, group_id: int, origin: Bot) -> GroupRoute:
+        return GroupRoute(self, group_id, origin)
+
+    def _health(self, self_id: str) -> AccountHealth:
+        health = self.health.get(self_id)
+        if health is None:
+            health = self.health[self_id] = AccountHealth()
+        return health
+
+    def _healthy(self, self_id: str, now: float) -> bool:
+        health = self.health.get(self_id)
+        return health is None or health.failures < self.unhealthy_after or now - health.last_failure >= self.cooldown
+
+    def candidates(self, group_id: int, origin: Bot, need_admin: bool, prefer_origin: bool) -> List[Bot]:
+        """Accounts to try for a call in ``group_id``, best first; never empty."""
+        now = time.monotonic()
+        eligible = self.admins if need_admin else self.members
+        bots = [
+            bot
+            for self_id, bot in self.get_bots().items()
+            if self_id != origin.self_id and group_id in eligible.get(self_id, ())
+        ]
+        # Unknown admin rights (not refreshed yet) still get a try, as before
+        origin_known = origin.self_id in eligible
+        if not origin_known or group_id in eligible[origin.self_id]:
+            bots.append(origin)
+
+        def score(bot: Bot) -> Tuple[int, int, float]:
+            health = self.health.get(bot.self_id)
+            return (
+                0 if self._healthy(bot.self_id, now) else 1,
+                0 if prefer_origin and bot is origin else 1,
+                health.latency * (1 + health.failures) if health else 0.0,
+            )
+
+        bots.sort(key=score)
+        if not bots:
+            bots.append(origin)
+        return bots
+
+    async def call(self, group_id: int, origin: Bot, api: str, data: Dict[str, Any], prefer_origin: bool) -> Any:
+        """Run ``api`` on the best account, failing over to the next on errors."""
+        error: Optional[Exception] = None
+        bots = self.candidates(group_id, origin, api in _ADMIN_APIS, prefer_origin)
+        permissions = self.permissions
+        if api == "set_group_ban" and permissions is not None and "user_id" in data:
+            # An admin can't mute another admin; the owner can, so try it first
+            now, target = time.time(), int(data["user_id"])
+            bots.sort(key=lambda bot: not permissions.allows(group_id, int(bot.self_id), target, now))
+        for bot in bots:
+            start = time.perf_counter()
+            try:
+                result = await bot.call_api(api, **data)
+            except _HEALTH_ERRORS as e:
+                self._health(bot.self_id).record(time.perf_counter() - start, False)
+                metrics.inc("account_failovers", api, label_name="api")
+                error = e
+                continue
+            except ActionFailed as e:
+                # The account answered; it just couldn't do it (rights, target, ...)
+                self._health(bot.self_id).record(time.perf_counter() - start, True)
+                metrics.inc("account_failovers", api, label_name="api")
+                error = e
+                continue
+            self._health(bot.self_id).record(time.perf_counter() - start, True)
+            return result
+        raise error if error else RuntimeError(f"No account available for {api} in group {group_id}")
+
+    async def refresh(self, bot: Bot, wanted: Callable[[int], bool] = lambda group_id: True, pause: float = 0.1):
+        """Re-read which (wanted) groups ``bot`` is in and where it is admin or owner."""
+        groups = await bot.get_group_list()
+        members: Set[int] = set()
+        admins: Set[int] = set()
+        for group in groups:
+            group_id = int(group["group_id"])
+            if not wanted(group_id):
+                continue
+            members.add(group_id)
+            try:
+                info = await bot.get_group_member_info(group_id=group_id, user_id=int(bot.self_id), no_cache=True)
+            except Exception as e:
+                logger.warning(f"Could not read role of {bot.self_id} in group {group_id}: {e}")
+                continue
+            role = info.get("role") or "member"
+            if self.permissions is not None:
+                self.permissions.put(group_id, int(bot.self_id), role, time.time())
+            if role in ("admin", "owner"):
+                admins.add(group_id)
+            # Spread the lookups out rather than bursting them at the server
+            await asyncio.sleep(pause)
+        self.members[bot.self_id] = members
+        self.admins[bot.self_id] = admins
+
+    def role_changed(self, group_id: int, user_id: int, role: str):
+        """Apply a group_admin notice: ``user_id`` is now ``role`` in the group."""
+        if self.permissions is not None:
+            self.permissions.put(group_id, user_id, role, time.time())
+        admins = self.admins.get(str(user_id))
+        if admins is not None:
+            if role in ("admin", "owner"):
+                admins.add(group_id)
+            else:
+                admins.discard(group_id)
+
+    async def refresh_all(self, wanted: Callable[[int], bool] = lambda group_id: True):
+        for self_id, bot in list(self.get_bots().items()):
+            try:
+                await self.refresh(bot, wanted)
+            except Exception as e:
+                logger.error(f"Refreshing admin map for {self_id} failed: {e}")
+
+    def forget(self, self_id: str):
+        self.admins.pop(self_id, None)
+        self.members.pop(self_id, None)
+        self.health.pop(self_id, None)
+
+    def latencies(self) -> Dict[str, float]:
+        return {self_id: health.latency * 1000 for self_id, health in self.health.items()}
+
+    def admin_counts(self) -> Dict[str, float]:
+        return {self_id: len(groups) for self_id, groups in self.admins.items()}
@@ -0,0 +1,200 @@
+import json
+import math
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from nonebot.log import logger
+
+from .persistence import WriteBehindFile
+
+BASELINE_FILE = Path("baselines.json")
+
+# Settings that /bot_threshold can pin per group
+OVERRIDE_KEYS = ("spam_threshold", "interaction_threshold")
+
+# Empty buckets folded in one go after a long silence; beyond this the
+# average has decayed to (almost) nothing anyway
+_MAX_IDLE_BUCKETS = 64
+
+
+class _Rate:
+    """EWMA of messages per bucket for one (group, bot): five numbers, however long it runs."""
+
+    __slots__ = ("bucket", "count", "mean", "samples", "var")
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, samples: int = 0, bucket: int = -1):
+        self.mean = mean
+        self.var = var
+        self.samples = samples
+        self.bucket = bucket
+        self.count = 0
+
+    def fold(self, value: float, alpha: float):
+        # Incremental exponentially weighted mean and variance
+        diff = value - self.mean
+        incr = alpha * diff
+        self.mean += incr
+        self.var = (1 - alpha) * (self.var + diff * incr)
+        self.samples += 1
+
+
+class BaselineTracker:
+    """Per-group spam thresholds learned from each bot's own traffic.
+
+    Messages are counted in buckets as long as the detection window. Every
+    finished bucket updates an EWMA of the count and its variance, and once a
+    bot has ``warmup`` buckets of history its spam threshold becomes
+    ``mean + sigmas * stddev``, clamped to ``[floor, ceiling]``. Counts are
+    capped at the current threshold before folding, so a flood does not teach
+    the baseline to tolerate floods.
+
+    Superusers can pin thresholds per group; pinned values win over both the
+    learned and the configured ones. Baselines and overrides are saved to
+    ``path`` with write-behind.
+    """
+
+    def __init__(
+        self,
+        bucket: float,
+        alpha: float = 0.05,
+        sigmas: float = 4.0,
+        warmup: int = 20,
+        floor: int = 3,
+        ceiling: int = 20,
+        adaptive: bool = True,
+        path: Optional[Path] = BASELINE_FILE,
+    ):
+        self.bucket = bucket
+        self.alpha = alpha
+        self.sigmas = sigmas
+        self.warmup = warmup
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.adaptive = adaptive
+        self.rates: Dict[Tuple[int, int], _Rate] = {}
+        self.overrides: Dict[int, Dict[str, int]] = {}
+        self.path = path
+        self._store = WriteBehindFile(path, self._snapshot, delay=30.0) if path else None
+        self._load()
+
+    def observe(self, group_id: int, bot_id: int, now: float, default: int):
+        """Count one message from ``bot_id``; ``default`` is the configured spam threshold."""
+        if not self.adaptive:
+            return
+        index = int(now // self.bucket)
+        rate = self.rates.get((group_id, bot_id))
+        if rate is None:
+            rate = self.rates[(group_id, bot_id)] = _Rate(bucket=index)
+        elif index > rate.bucket:
+            cap = self.spam_threshold(group_id, bot_id, default)
+            if rate.bucket >= 0:
+                rate.fold(min(rate.count, cap), self.alpha)
+                for _ in range(min(index - rate.bucket - 1, _MAX_IDLE_BUCKETS)):
+                    rate.fold(0, self.alpha)
+            rate.bucket = index
+            rate.count = 0
+            if self._store:
+                self._store.mark_dirty()
+        rate.count += 1
+
+    def resize(self, bucket: float):
+        """Switch to ``bucket``-second buckets, rescaling what was learned at the old size.
+
+        Counts are treated as Poisson-like, so mean and variance both scale
+        with the bucket length. The bucket in progress is dropped, since its
+        index means nothing at the new size.
+        """
+        if bucket == self.bucket:
+            return
+        scale = bucket / self.bucket
+        for rate in self.rates.values():
+            rate.mean *= scale
+            rate.var *= scale
+            rate.bucket = -1
+            rate.count = 0
+        self.bucket = bucket
+        if self.rates and self._store:
+            self._store.mark_dirty()
+
+    def learned(self, group_id: int, bot_id: int) -> Optional[int]:
+        """Threshold derived from the bot's baseline, or None while warming up."""
+        rate = self.rates.get((group_id, bot_id))
+        if rate is None or rate.samples < self.warmup:
+            return None
+        limit = math.ceil(rate.mean + self.sigmas * math.sqrt(max(rate.var, 0.0)))
+        return min(max(limit, self.floor), self.ceiling)
+
+    def spam_threshold(self, group_id: int, bot_id: int, default: int) -> int:
+        pinned = self.overrides.get(group_id)
+        if pinned and "spam_threshold" in pinned:
+            return pinned["spam_threshold"]
+        if self.adaptive:
+            learned = self.learned(group_id, bot_id)
+            if learned is not None:
+                return learned
+        return default
+
+    def interaction_threshold(self, group_id: int, default: int) -> int:
+        pinned = self.overrides.get(group_id)
+        if pinned and "interaction_threshold" in pinned:
+            return pinned["interaction_threshold"]
+        return default
+
+    def set_override(self, group_id: int, key: str, value: Optional[int]):
+        """Pin ``key`` to ``value`` in a group, or unpin it with None."""
+        pinned = self.overrides.setdefault(group_id, {})
+        if value is None:
+            pinned.pop(key, None)
+        else:
+            pinned[key] = value
+        if not pinned:
+            del self.overrides[group_id]
+        if self._store:
+            self._store.mark_dirty()
+
+    def clear_overrides(self, group_id: int):
+        if self.overrides.pop(group_id, None) is not None and self._store:
+            self._store.mark_dirty()
+
+    def group_baselines(self, group_id: int) -> List[Tuple[int, float, float, int]]:
+        """(bot, mean, stddev, samples) for every bot seen in the group."""
+        return sorted(
+            (bot_id, rate.mean, math.sqrt(max(rate.var, 0.0)), rate.samples)
+            for (group, bot_id), rate in self.rates.items()
+            if group == group_id
+        )
+
+    async def flush(self):
+        if self._store:
+            await self._store.flush()
+
+    def _snapshot(self) -> dict:
+        groups: Dict[str, Dict[str, list]] = {}
+        for (group_id, bot_id), rate in self.rates.items():
+            groups.setdefault(str(group_id), {})[str(bot_id)] = [
+                round(rate.mean, 6), round(rate.var, 6), rate.samples, rate.bucket,
+            ]
+        return {
+            "bucket": self.bucket,
+            "baselines": groups,
+            "overrides": {str(group_id): pinned for group_id, pinned in self.overrides.items()},
+        }
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for group_id, pinned in data.get("overrides", {}).items():
+                self.overrides[int(group_id)] = {
+                    key: int(value) for key, value in pinned.items() if key in OVERRIDE_KEYS
+                }
+            # Counts per bucket only mean the same thing at the same bucket size
+            if data.get("bucket") != self.bucket:
+                return
+            for group_id, bots in data.get("baselines", {}).items():
+                for bot_id, (mean, var, samples, bucket) in bots.items():
+                    self.rates[(int(group_id), int(bot_id))] = _Rate(mean, var, samples, bucket)
+        except Exception as e:
+            logger.error(f"Error loading baselines: {e}")
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import dotenv_values
+from nonebot.compat import field_validator, model_dump, model_fields, type_validate_python
+from nonebot.log import logger
+from pydantic import BaseModel, Field
+
+
+def parse_groups(value: Any) -> Set[int]:
+    """ENABLED_GROUPS as a JSON list, a single id, or comma-separated ids."""
+    if isinstance(value, str):
+        try:
+            loaded = json.loads(value)
+            value = loaded if isinstance(loaded, list) else [loaded]
+        except json.JSONDecodeError:
+            # If not JSON, try comma separated
+            value = [g.strip() for g in value.split(",") if g.strip()]
+    if value is None:
+        return set()
+    if not isinstance(value, (list, tuple, set)):
+        value = [value]
+    return {int(g) for g in value}
+
+
+class ReloadableConfig(BaseModel):
+    """Settings that /reload, /set_threshold and the file watcher can change at runtime."""
+
+    enabled_groups: Set[int] = set()
+    history_window: float = Field(default=240, gt=0)
+    detection_window: float = Field(default=30, gt=0)
+    interaction_threshold: int = Field(default=2, ge=1)
+    spam_threshold: int = Field(default=5, ge=1)
+    ban_duration: int = Field(default=600, ge=1)
+    ban_multiplier: float = Field(default=2.0, ge=1)
+    ban_max_duration: int = Field(default=86400, ge=0)
+    duplicate_spam_factor: float = Field(default=0.6, gt=0, le=1)
+
+    @field_validator("enabled_groups", mode="before")
+    @classmethod
+    def _parse_groups(cls, value: Any) -> Set[int]:
+        return parse_groups(value)
+
+
+def validate_config(values: Dict[str, Any]) -> ReloadableConfig:
+    """Build a ReloadableConfig from (lower-case) keys; unknown keys are ignored."""
+    fields = {field.name for field in model_fields(ReloadableConfig)}
+    return type_validate_python(
+        ReloadableConfig,
+        {key: value for key, value in values.items() if key in fields},
+    )
+
+
+def config_changes(old: ReloadableConfig, new: ReloadableConfig) -> List[Tuple[str, Any, Any]]:
+    """(key, old value, new value) for every setting that differs."""
+    before = model_dump(old)
+    after = model_dump(new)
+    return [(key, before[key], after[key]) for key in after if before[key] != after[key]]
+
+
+def parse_value(raw: Optional[str]) -> Any:
+    # Same convention as NoneBot: JSON if it parses, the raw string otherwise
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return raw
+
+
+class ConfigWatcher:
+    """Re-reads the dotenv files when they change and hands the values to ``on_change``.
+
+    Files are merged in order (later ones win) and process environment
+    variables override them, as NoneBot does at startup. Changes are picked
+    up with watchfiles when it is installed, otherwise by polling mtimes
+    every ``interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        paths: List[Path],
+        on_change: Callable[[Dict[str, Any]], Awaitable[Any]],
+        interval: float = 5.0,
+    ):
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._mtimes = self._stat()
+
+    def read(self) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for path in self.paths:
+            if path.exists():
+                for key, raw in dotenv_values(path).items():
+                    values[key.lower()] = parse_value(raw)
+        for key, raw in os.environ.items():
+            if key.lower() in values:
+                values[key.lower()] = parse_value(raw)
+        return values
+
+    def _stat(self) -> List[Optional[float]]:
+        mtimes: List[Optional[float]] = []
+        for path in self.paths:
+            try:
+                mtimes.append(path.stat().st_mtime)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    async def check(self) -> bool:
+        """Reload if any file changed since the last check; True if it did."""
+        mtimes = self._stat()
+        if mtimes == self._mtimes:
+            return False
+        self._mtimes = mtimes
+        await self.on_change(self.read())
+        return True
+
+    async def run(self):
+        try:
+            from watchfiles import awatch  # pyright: ignore[reportMissingImports]
+        except ImportError:
+            awatch = None
+
+        if awatch is None:
+            await self._poll()
+            return
+
+        # Watch the directories, since editors often replace files rather than
+        # write them, but only wake up for the .env files themselves: the
+        # working directory also holds databases, snapshots and the like
+        names = {str(path.resolve()) for path in self.paths}
+        directories = {str(path.resolve().parent) for path in self.paths}
+        async for _ in awatch(
+            *directories,
+            recursive=False,
+            watch_filter=lambda change, changed: str(Path(changed).resolve()) in names,
+        ):
+            await self._check_logged()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._check_logged()
+
+    async def _check_logged(self):
+        try:
+            await self.check()
+        except Exception as e:
+            logger.error(f"Config reload failed: {e}")
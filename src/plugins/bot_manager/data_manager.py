@@ -1,52 +1,69 @@
-import json
-from pathlib import Path
-from typing import List, Set
+from typing import Callable, Dict, List, Optional, Set
 
-DATA_FILE = Path("bots.json")
+from .storage import GLOBAL_SCOPE, BotStorage, JsonBotStorage
 
 class BotManager:
-    def __init__(self):
-        self.bot_list: Set[int] = set()
+    """Monitored bot lists per scope (a group id, or GLOBAL_SCOPE for every group).
+
+    Lookups are served from the in-memory index, which is updated alongside
+    each single-row change written to the storage backend.
+    """
+
+    def __init__(self, storage: Optional[BotStorage] = None):
+        self.storage = storage or JsonBotStorage()
+        self.scopes: Dict[int, Set[int]] = {}
+        # Called after every change to the lists (e.g. to rebuild caches)
+        self.listeners: List[Callable[[], None]] = []
         self.load_data()
 
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    @property
+    def bot_list(self) -> Set[int]:
+        return self.scopes[GLOBAL_SCOPE]
+
     def load_data(self):
-        if DATA_FILE.exists():
-            try:
-                with open(DATA_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.bot_list = set(data.get("bots", []))
-            except Exception as e:
-                print(f"Error loading bot list: {e}")
-                self.bot_list = set()
-        else:
-            self.bot_list = set()
-            self.save_data()
-
-    def save_data(self):
-        try:
-            with open(DATA_FILE, "w", encoding="utf-8") as f:
-                json.dump({"bots": list(self.bot_list)}, f, indent=4)
-        except Exception as e:
-            print(f"Error saving bot list: {e}")
-
-    def add_bot(self, qq: int) -> bool:
-        if qq not in self.bot_list:
-            self.bot_list.add(qq)
-            self.save_data()
+        self.scopes = self.storage.load()
+        self.scopes.setdefault(GLOBAL_SCOPE, set())
+        self._notify()
+
+    async def flush(self):
+        """Write pending changes now; called on driver shutdown."""
+        await self.storage.flush()
+
+    def add_bot(self, qq: int, scope: int = GLOBAL_SCOPE) -> bool:
+        bots = self.scopes.setdefault(scope, set())
+        if qq not in bots:
+            bots.add(qq)
+            self.storage.add(scope, qq)
+            self._notify()
             return True
         return False
 
-    def remove_bot(self, qq: int) -> bool:
-        if qq in self.bot_list:
-            self.bot_list.remove(qq)
-            self.save_data()
+    def remove_bot(self, qq: int, scope: int = GLOBAL_SCOPE) -> bool:
+        bots = self.scopes.get(scope)
+        if bots and qq in bots:
+            bots.remove(qq)
+            if not bots and scope != GLOBAL_SCOPE:
+                del self.scopes[scope]
+            self.storage.remove(scope, qq)
+            self._notify()
             return True
         return False
 
-    def get_bots(self) -> List[int]:
-        return list(self.bot_list)
-
-    def is_bot(self, qq: int) -> bool:
-        return qq in self.bot_list
+    def get_bots(self, group_id: Optional[int] = None) -> List[int]:
+        """Bots monitored everywhere, plus those scoped to ``group_id`` if given."""
+        bots = set(self.bot_list)
+        if group_id is not None:
+            bots |= self.scopes.get(group_id, set())
+        return sorted(bots)
 
-bot_manager = BotManager()
+    def is_bot(self, qq: int, group_id: Optional[int] = None) -> bool:
+        if qq in self.bot_list:
+            return True
+        if group_id is None:
+            return False
+        bots = self.scopes.get(group_id)
+        return bots is not None and qq in bots
@@ -0,0 +1,41 @@
+from typing import Set, Tuple
+
+from .metrics import metrics
+
+
+class DedupIndex:
+    """Recently seen (group_id, message_id) pairs, bounded in both age and count.
+
+    Keys go into the current generation; the previous one is kept for
+    lookups only. Generations rotate every ``ttl / 2`` seconds, or early once
+    the current one holds ``max_entries / 2`` keys, so a key is remembered
+    for between ``ttl / 2`` and ``ttl`` seconds (less under heavy load) and
+    at most ``max_entries`` keys are held. No per-entry timestamps, and
+    nothing is ever deleted one by one.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 65536):
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 2)
+        self._current: Set[Tuple[int, int]] = set()
+        self._previous: Set[Tuple[int, int]] = set()
+        self._rotated_at = float("-inf")
+
+    def first_seen(self, group_id: int, message_id: int, now: float) -> bool:
+        """Record the message; False if it was seen recently."""
+        if now - self._rotated_at >= self.ttl / 2 or len(self._current) >= self.max_entries // 2:
+            # After a long gap, the previous generation is stale as well
+            self._previous = self._current if now - self._rotated_at < self.ttl else set()
+            self._current = set()
+            self._rotated_at = now
+
+        key = (group_id, message_id)
+        if key in self._current or key in self._previous:
+            metrics.inc("dedup_lookups", "hit", label_name="result")
+            return False
+        metrics.inc("dedup_lookups", "miss", label_name="result")
+        self._current.add(key)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
@@ -0,0 +1,266 @@
+import time
+from typing import Any, Callable, Iterable, List, NamedTuple, Optional
+
+from nonebot.log import logger
+
+from .accounts import GroupRoute, ModerationBot
+from .baseline import BaselineTracker
+from .fingerprint import FingerprintWindow
+from .graph import InteractionGraph
+from .metrics import metrics
+from .moderation import RecallQueue
+from .notices import Notice, NoticeScheduler
+from .offenders import OffenderIndex
+from .permissions import PermissionCache
+from .state import DetectionState
+
+
+class DetectionSettings(NamedTuple):
+    history_window: float = 240
+    detection_window: float = 30
+    interaction_threshold: int = 2
+    spam_threshold: int = 5
+    ban_duration: int = 600
+    # Repeat offenders: ban_duration * ban_multiplier ** (decayed prior offenses), capped
+    ban_multiplier: float = 2.0
+    ban_max_duration: int = 86400
+    # Spam threshold multiplier once a bot repeats (near-)identical text
+    duplicate_factor: float = 0.6
+
+
+class Decision(NamedTuple):
+    """One punishment the detector went through with (or tried to)."""
+
+    group_id: int
+    offender: int
+    kind: str
+    reason: str
+    message_ids: List[int]
+    banned: bool
+    timestamp: float
+
+
+def collect_targets(
+    sender_id: int,
+    reply_sender_id: Optional[int],
+    at_targets: Iterable[Any],
+    is_bot: Callable[[int], bool],
+) -> List[int]:
+    """Monitored bots other than the sender that a message replies to or @s, in order."""
+    targets: List[int] = []
+    if reply_sender_id is not None and reply_sender_id != sender_id and is_bot(reply_sender_id):
+        targets.append(reply_sender_id)
+    for target_qq in at_targets:
+        # Already ints when they come from a MessageView
+        if isinstance(target_qq, int):
+            target_qq_int = target_qq
+        elif target_qq and target_qq != "all" and str(target_qq).isdigit():
+            target_qq_int = int(target_qq)
+        else:
+            continue
+        # Avoid adding the same bot twice if replied and mentioned
+        if target_qq_int != sender_id and target_qq_int not in targets and is_bot(target_qq_int):
+            targets.append(target_qq_int)
+    return targets
+
+
+class Detector:
+    """The loop/spam detection pipeline behind handle_monitor, free of NoneBot matchers.
+
+    ``process`` takes one message from a monitored bot. Bans, recalls and
+    announcements go through the given ``bot`` (anything with the OneBot
+    ``set_group_ban``/``delete_msg``/``send_group_msg`` calls), and every
+    decision is passed to the ``listeners``.
+    """
+
+    def __init__(
+        self,
+        state: DetectionState,
+        graph: InteractionGraph,
+        recall_queue: RecallQueue,
+        settings: DetectionSettings,
+        fingerprints: Optional[FingerprintWindow] = None,
+        baselines: Optional[BaselineTracker] = None,
+        offenders: Optional[OffenderIndex] = None,
+        notices: Optional[NoticeScheduler] = None,
+        permissions: Optional[PermissionCache] = None,
+    ):
+        self.state = state
+        self.graph = graph
+        self.fingerprints = fingerprints or FingerprintWindow(settings.detection_window)
+        # Per-group thresholds; without one, the configured values apply everywhere
+        self.baselines = baselines or BaselineTracker(settings.detection_window, adaptive=False, path=None)
+        self.offenders = offenders or OffenderIndex(settings.ban_duration * 6, path=None)
+        # Announcements; the default sends each one right away
+        self.notices = notices or NoticeScheduler(window=0, group_rate=0, global_rate=0)
+        # set_group_ban calls awaiting a response, so notices can wait for them
+        self.bans_in_flight = 0
+        # Roles, to skip bans that can't work; without it every ban is tried
+        self.permissions = permissions
+        self.recall_queue = recall_queue
+        self.settings = settings
+        self.listeners: List[Callable[[Decision], None]] = []
+
+    async def process(
+        self,
+        bot: ModerationBot,
+        group_id: int,
+        sender_id: int,
+        message_id: int,
+        targets: List[int],
+        now: float,
+        text: str = "",
+    ):
+        settings = self.settings
+
+        # Already being banned (or serving a ban): don't count or act again
+        if await self.state.is_punished(group_id, sender_id, now):
+            return
+
+        for target_id in targets:
+            logger.info(f"Bot Interaction: {sender_id} -> {target_id} in Group {group_id}")
+
+        # Record the message and trim the sender's windows
+        stage_start = time.perf_counter()
+        window = await self.state.observe(group_id, sender_id, message_id, targets, now)
+        stage_end = time.perf_counter()
+        metrics.observe("stage_seconds", "window", stage_end - stage_start)
+
+        # Loop between several bots (A -> B -> C -> A): ban everyone on the cycle
+        cycle = None
+        for target_id in targets:
+            cycle = self.graph.add(group_id, sender_id, target_id, now)
+            if cycle:
+                break
+        metrics.observe("stage_seconds", "graph", time.perf_counter() - stage_end)
+        if cycle:
+            loop_text = " → ".join(str(qq) for qq in [*cycle, cycle[0]])
+            reason = f"检测到机器人循环对话（{loop_text}）"
+            for member in cycle:
+                member_window = window if member == sender_id else await self.state.peek(group_id, member, now)
+                await self.punish(bot, group_id, member, reason, "cycle", member_window.interactions.recent_ids(), now)
+            return
+
+        # Check for loop/spam
+        stage_start = time.perf_counter()
+        baselines = self.baselines
+        baselines.observe(group_id, sender_id, now, settings.spam_threshold)
+        # 1. Interaction Limit: sender -> target interactions
+        interaction_count = len(window.interactions)
+        interaction_threshold = baselines.interaction_threshold(group_id, settings.interaction_threshold)
+        # 2. Rate Limit: sender -> group message count against the group's
+        # threshold, stricter when the bot keeps posting (near-)identical text
+        message_count = len(window.messages)
+        spam_threshold = baselines.spam_threshold(group_id, sender_id, settings.spam_threshold)
+        duplicates = self.fingerprints.observe(group_id, sender_id, text, now) if text else 0
+        if duplicates:
+            spam_threshold = max(2, int(spam_threshold * settings.duplicate_factor))
+
+        reason = ""
+        reason_kind = ""
+        messages_to_recall: List[int] = []
+
+        if interaction_count >= interaction_threshold:
+            reason = f"检测到互怼/频繁回复（{interaction_count}次交互/{settings.detection_window}秒）"
+            reason_kind = "interaction"
+            messages_to_recall = window.interactions.recent_ids()
+        elif message_count >= spam_threshold:
+            if duplicates:
+                reason = f"检测到重复刷屏（{message_count}条消息/{settings.detection_window}秒，内容重复）"
+                reason_kind = "duplicate"
+            else:
+                reason = f"检测到刷屏（{message_count}条消息/{settings.detection_window}秒）"
+                reason_kind = "spam"
+            messages_to_recall = window.messages.recent_ids()
+        metrics.observe("stage_seconds", "detect", time.perf_counter() - stage_start)
+
+        if reason:
+            await self.punish(bot, group_id, sender_id, reason, reason_kind, messages_to_recall, now)
+
+    async def punish(
+        self,
+        bot: ModerationBot,
+        group_id: int,
+        offender: int,
+        reason: str,
+        reason_kind: str,
+        messages_to_recall: List[int],
+        now: float,
+    ):
+        """Ban an offender once, recall their messages and announce it in the group."""
+        settings = self.settings
+        # Only one handler (or process) acts on a given offender
+        if not await self.state.claim(group_id, offender, now):
+            return
+        ban_duration = self.offenders.ban_duration(
+            group_id, offender, now, settings.ban_duration, settings.ban_multiplier, settings.ban_max_duration
+        )
+        logger.warning(f"Bot ban triggered: {reason}. Bot: {offender}, Group: {group_id}")
+
+        # Known not to work: don't ban (or recall, which needs the same rights),
+        # and hold the offender for a ban's length so this isn't announced again
+        # on every message
+        blocked = ""
+        if self.permissions is not None:
+            # Every account the ban may go through, not just the one that saw the event
+            actors = bot.ban_accounts() if isinstance(bot, GroupRoute) else [int(bot.self_id)]
+            blocked = await self.permissions.blocker(bot, group_id, offender, actors, now)
+        if blocked:
+            logger.warning(f"Not banning {offender} in group {group_id}: {blocked}")
+            metrics.inc("bans_skipped", blocked)
+            await self.state.mark_punished(group_id, offender, now, ban_duration)
+            self._decide(Decision(group_id, offender, reason_kind, reason, messages_to_recall, False, now))
+            self.notices.post(bot, group_id, Notice(offender, reason, 0, blocked))
+            return
+
+        # Mute the offender
+        stage_start = time.perf_counter()
+        self.bans_in_flight += 1
+        try:
+            await bot.set_group_ban(
+                group_id=group_id,
+                user_id=offender,
+                duration=ban_duration
+            )
+        except Exception as e:
+            metrics.observe("stage_seconds", "ban", time.perf_counter() - stage_start)
+            metrics.inc("ban_failures", reason_kind)
+            await self.state.release(group_id, offender)
+            if self.permissions is not None:
+                # Roles may have changed since they were cached
+                self.permissions.invalidate(group_id)
+            logger.error(f"Failed to ban bot {offender}: {e}")
+            self._decide(Decision(group_id, offender, reason_kind, reason, messages_to_recall, False, now))
+            self.notices.post(bot, group_id, Notice(offender, reason, 0))
+            return
+        finally:
+            self.bans_in_flight -= 1
+
+        metrics.observe("stage_seconds", "ban", time.perf_counter() - stage_start)
+        metrics.inc("bans", reason_kind)
+        await self.state.mark_punished(group_id, offender, now, ban_duration)
+        self.offenders.record(group_id, offender, now)
+        self._decide(Decision(group_id, offender, reason_kind, reason, messages_to_recall, True, now))
+
+        # Recall messages in the background
+        metrics.inc("recalls_queued", reason_kind, self.recall_queue.enqueue(bot, messages_to_recall))
+        self.notices.post(bot, group_id, Notice(offender, reason, ban_duration))
+
+    def update_settings(self, settings: DetectionSettings):
+        """Swap in new settings; windows, history and learned baselines are kept."""
+        self.state.resize(settings.detection_window, settings.history_window)
+        self.fingerprints.window = settings.detection_window
+        self.baselines.resize(settings.detection_window)
+        self.settings = settings
+
+    def sweep(self, now: float):
+        """Drop process-local graph edges, fingerprints, offenders and roles that have expired."""
+        self.graph.sweep(now)
+        self.fingerprints.sweep(now)
+        self.offenders.sweep(now)
+        if self.permissions is not None:
+            self.permissions.sweep(now)
+
+    def _decide(self, decision: Decision):
+        for listener in self.listeners:
+            listener(decision)
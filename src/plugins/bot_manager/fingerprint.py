@@ -0,0 +1,111 @@
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# Only the first MAX_CHARS characters are fingerprinted, so cost and memory
+# are bounded however long a message is
+MAX_CHARS = 512
+SHINGLE = 3
+
+# _SPREAD[pos][b] places bit i of byte b (at byte position pos of a 64-bit
+# hash) into its own 16-bit lane, so summing spread values counts every bit
+# position of many hashes at once with a few big-int additions.
+_LANE = 16
+_SPREAD: List[List[int]] = []
+for _pos in range(8):
+    _row = []
+    for _byte in range(256):
+        value = 0
+        for _bit in range(8):
+            if _byte >> _bit & 1:
+                value |= 1 << ((_pos * 8 + _bit) * _LANE)
+        _row.append(value)
+    _SPREAD.append(_row)
+_LANE_MASK = (1 << _LANE) - 1
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash of character 3-grams; None for messages without text."""
+    text = " ".join(text[:MAX_CHARS].split())
+    if not text:
+        return None
+    if len(text) <= SHINGLE:
+        shingles = [text]
+    else:
+        shingles = [text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)]
+
+    # Two CRC32s make the 64-bit shingle hash; C-level and much cheaper than hashlib
+    s0, s1, s2, s3, s4, s5, s6, s7 = _SPREAD
+    crc32 = zlib.crc32
+    totals = 0
+    for shingle in shingles:
+        data = shingle.encode("utf-8")
+        lo = crc32(data)
+        hi = crc32(data, 0x9E3779B9)
+        totals += (
+            s0[lo & 0xFF] + s1[lo >> 8 & 0xFF] + s2[lo >> 16 & 0xFF] + s3[lo >> 24]
+            + s4[hi & 0xFF] + s5[hi >> 8 & 0xFF] + s6[hi >> 16 & 0xFF] + s7[hi >> 24]
+        )
+
+    half = len(shingles) / 2
+    signature = 0
+    for bit in range(64):
+        if (totals >> (bit * _LANE) & _LANE_MASK) > half:
+            signature |= 1 << bit
+    return signature
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class _Prints:
+    """Ring buffer of the last ``size`` (timestamp, signature) pairs for one sender."""
+
+    __slots__ = ("next", "signatures", "timestamps")
+
+    def __init__(self, size: int):
+        self.timestamps = array("d", [float("-inf")] * size)
+        self.signatures = array("Q", [0] * size)
+        self.next = 0
+
+
+class FingerprintWindow:
+    """Recent message fingerprints per (group, sender), for near-duplicate checks.
+
+    Each sender keeps at most ``size`` signatures (16 bytes each), so lookups
+    compare against a fixed number of entries.
+    """
+
+    def __init__(self, window: float, size: int = 16, max_distance: int = 8):
+        self.window = window
+        self.size = max(size, 1)
+        self.max_distance = max_distance
+        self.senders: Dict[Tuple[int, int], _Prints] = {}
+
+    def observe(self, group_id: int, sender_id: int, text: str, now: float) -> int:
+        """Record a message; returns how many recent messages it nearly duplicates."""
+        signature = simhash(text)
+        if signature is None:
+            return 0
+        key = (group_id, sender_id)
+        prints = self.senders.get(key)
+        if prints is None:
+            prints = self.senders[key] = _Prints(self.size)
+
+        start = now - self.window
+        duplicates = 0
+        for ts, other in zip(prints.timestamps, prints.signatures):
+            if ts >= start and hamming(signature, other) <= self.max_distance:
+                duplicates += 1
+
+        prints.timestamps[prints.next] = now
+        prints.signatures[prints.next] = signature
+        prints.next = (prints.next + 1) % self.size
+        return duplicates
+
+    def sweep(self, now: float):
+        """Forget senders with nothing inside the window."""
+        start = now - self.window
+        for key in [k for k, p in self.senders.items() if max(p.timestamps) < start]:
+            del self.senders[key]
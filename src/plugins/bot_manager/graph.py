@@ -0,0 +1,83 @@
+import math
+from typing import Dict, List, Optional
+
+# Edges whose weight decays below this are dropped by sweep()
+_PRUNE_WEIGHT = 0.05
+
+
+class InteractionGraph:
+    """Per-group directed "A @/replies to B" graph with time-decayed edge weights.
+
+    An edge's weight halves every ``half_life`` seconds and gains 1 per
+    interaction; decay is applied lazily from the edge's last update, so an
+    interaction touches exactly one edge. After each update ``add`` looks for
+    a path back from the target to the sender over edges still weighing at
+    least ``min_weight``, bounded by ``max_length`` nodes, and returns the
+    cycle it closes. Cycles shorter than ``min_length`` are not reported: two
+    bots answering each other once is an ordinary reply, and a real back and
+    forth is left to the per-sender interaction threshold.
+    """
+
+    def __init__(self, half_life: float, min_weight: float, max_length: int, min_length: int = 3):
+        self.set_half_life(half_life)
+        self.min_weight = min_weight
+        self.min_length = max(min_length, 2)
+        self.max_length = max(max_length, self.min_length)
+        # group_id -> source -> target -> [weight, updated]
+        self.groups: Dict[int, Dict[int, Dict[int, List[float]]]] = {}
+
+    def set_half_life(self, half_life: float):
+        # Edges decay from their last update, so existing weights just follow the new rate
+        self.decay = math.log(2) / max(half_life, 1e-9)
+
+    def _weight(self, edge: List[float], now: float) -> float:
+        return edge[0] * math.exp(-self.decay * (now - edge[1]))
+
+    def add(self, group_id: int, source: int, target: int, now: float) -> Optional[List[int]]:
+        """Record source -> target; returns the cycle's nodes if one is now active."""
+        graph = self.groups.setdefault(group_id, {})
+        edges = graph.setdefault(source, {})
+        edge = edges.get(target)
+        if edge is None:
+            edges[target] = [1.0, now]
+            weight = 1.0
+        else:
+            weight = self._weight(edge, now) + 1
+            edge[0] = weight
+            edge[1] = now
+        if weight < self.min_weight:
+            return None
+        path = self._find_path(graph, target, source, now)
+        if path is None:
+            return None
+        return [source, *path[:-1]]
+
+    def _find_path(self, graph, start: int, goal: int, now: float) -> Optional[List[int]]:
+        # Depth-limited DFS over active edges; graphs hold a handful of bots
+        stack = [(start, [start])]
+        while stack:
+            node, path = stack.pop()
+            for nxt, edge in graph.get(node, {}).items():
+                if self._weight(edge, now) < self.min_weight:
+                    continue
+                if nxt == goal:
+                    if len(path) + 1 >= self.min_length:
+                        return path + [goal]
+                    continue
+                if nxt in path or len(path) + 1 >= self.max_length:
+                    continue
+                stack.append((nxt, path + [nxt]))
+        return None
+
+    def sweep(self, now: float):
+        """Drop edges that have decayed to nothing, and empty groups."""
+        for group_id in list(self.groups):
+            graph = self.groups[group_id]
+            for source in list(graph):
+                edges = graph[source]
+                for target in [t for t, e in edges.items() if self._weight(e, now) < _PRUNE_WEIGHT]:
+                    del edges[target]
+                if not edges:
+                    del graph[source]
+            if not graph:
+                del self.groups[group_id]
@@ -0,0 +1,59 @@
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from nonebot.adapters.onebot.v11 import GroupMessageEvent
+
+# Where the parsed view is kept on the event itself (events allow extra
+# attributes), so it lives and dies with the event
+_VIEW_ATTR = "_bot_manager_view"
+
+
+class MessageView(NamedTuple):
+    """What the handlers need from a message, parsed in one pass over its segments."""
+
+    # @-mentioned QQ numbers in order, without duplicates or @all
+    mentions: Tuple[int, ...]
+    mentions_all: bool
+    # Sender of the replied-to message, if any
+    reply_to: Optional[int]
+    plain_text: str
+    text_length: int
+    # crc32 of the plain text, for cheap exact-repeat checks
+    content_hash: int
+
+
+def parse_message(event: GroupMessageEvent) -> MessageView:
+    mentions: List[int] = []
+    seen = set()
+    mentions_all = False
+    texts: List[str] = []
+    for seg in event.message:
+        if seg.type == "text":
+            texts.append(seg.data.get("text", ""))
+        elif seg.type == "at":
+            qq = str(seg.data.get("qq", ""))
+            if qq == "all":
+                mentions_all = True
+            elif qq.isdigit() and qq not in seen:
+                seen.add(qq)
+                mentions.append(int(qq))
+    reply_to = event.reply.sender.user_id if event.reply else None
+    # Same result as Message.extract_plain_text()
+    plain_text = "".join(texts)
+    return MessageView(
+        tuple(mentions),
+        mentions_all,
+        reply_to,
+        plain_text,
+        len(plain_text),
+        zlib.crc32(plain_text.encode("utf-8")),
+    )
+
+
+def message_view(event: GroupMessageEvent) -> MessageView:
+    """The event's parsed view, computed on first use and shared by every matcher."""
+    view = getattr(event, _VIEW_ATTR, None)
+    if view is None:
+        view = parse_message(event)
+        setattr(event, _VIEW_ATTR, view)
+    return view
@@ -0,0 +1,182 @@
+import os
+import sys
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+# Upper bounds (seconds) shared by all latency histograms
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.000001, 0.0000025, 0.000005,
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``observe`` is a bisect and three additions."""
+
+    __slots__ = ("buckets", "count", "counts", "total")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """In-process stage timings, counters and gauges for the detection pipeline.
+
+    Histograms and counters are keyed by a (name, label) pair. Histogram
+    labels are stages; a counter's label is exported under the name given
+    to ``inc`` (``reason`` unless stated otherwise). Gauges are
+    callbacks evaluated only when the metrics are read. A gauge family is one
+    callback returning a value per label (e.g. per shard).
+    """
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], float] = {}
+        # Counter name -> what its labels are (reason, status, api, ...)
+        self.counter_labels: Dict[str, str] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {"process_resident_memory_bytes": _rss_bytes}
+        self.gauge_families: Dict[str, Tuple[str, Callable[[], Dict[str, float]]]] = {}
+
+    def observe(self, name: str, label: str, value: float):
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, label: str = "", amount: float = 1, label_name: str = "reason"):
+        key = (name, label)
+        if label:
+            self.counter_labels[name] = label_name
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        self.gauges[name] = func
+
+    def gauge_family(self, name: str, label: str, func: Callable[[], Dict[str, float]]):
+        self.gauge_families[name] = (label, func)
+
+    def read_gauge_families(self) -> Dict[str, Tuple[str, Dict[str, float]]]:
+        values = {}
+        for name, (label, func) in self.gauge_families.items():
+            try:
+                values[name] = (label, func())
+            except Exception:
+                values[name] = (label, {})
+        return values
+
+    def read_gauges(self) -> Dict[str, float]:
+        values = {}
+        for name, func in self.gauges.items():
+            try:
+                values[name] = func()
+            except Exception:
+                values[name] = float("nan")
+        return values
+
+    def summary(self) -> str:
+        """Plain-text report for the /bot_stats command."""
+        lines: List[str] = ["耗时统计 (次数 / p50 / p99 / 平均):"]
+        for (name, label), h in sorted(self.histograms.items()):
+            mean = h.total / h.count if h.count else 0.0
+            lines.append(
+                f"  {label or name}: {h.count} / {_fmt_seconds(h.quantile(0.5))}"
+                f" / {_fmt_seconds(h.quantile(0.99))} / {_fmt_seconds(mean)}"
+            )
+        lines.append("计数:")
+        for (name, label), value in sorted(self.counters.items()):
+            lines.append(f"  {name}{f'[{label}]' if label else ''}: {value:g}")
+        lines.append("状态:")
+        for name, value in self.read_gauges().items():
+            if name.endswith("_bytes"):
+                lines.append(f"  {name}: {value / 1048576:.1f} MiB")
+            else:
+                lines.append(f"  {name}: {value:g}")
+        for name, (_, samples) in self.read_gauge_families().items():
+            if samples:
+                lines.append(f"  {name}: " + ", ".join(f"{key}={value:g}" for key, value in samples.items()))
+        return "\n".join(lines)
+
+    def render_prometheus(self, prefix: str = "bot_manager") -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        out: List[str] = []
+        typed = set()
+        for (name, label), h in sorted(self.histograms.items()):
+            metric = f"{prefix}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                out.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                out.append(f'{metric}_bucket{{stage="{label}",le="{bound:g}"}} {cumulative}')
+            out.append(f'{metric}_bucket{{stage="{label}",le="+Inf"}} {h.count}')
+            out.append(f'{metric}_sum{{stage="{label}"}} {h.total:.9f}')
+            out.append(f'{metric}_count{{stage="{label}"}} {h.count}')
+        for (name, label), value in sorted(self.counters.items()):
+            metric = f"{prefix}_{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                out.append(f"# TYPE {metric} counter")
+            labels = f'{{{self.counter_labels.get(name, "reason")}="{label}"}}' if label else ""
+            out.append(f"{metric}{labels} {value:g}")
+        for name, value in self.read_gauges().items():
+            metric = f"{prefix}_{name}"
+            out.append(f"# TYPE {metric} gauge")
+            out.append(f"{metric} {value:g}")
+        for name, (label, samples) in self.read_gauge_families().items():
+            metric = f"{prefix}_{name}"
+            out.append(f"# TYPE {metric} gauge")
+            for key, value in samples.items():
+                out.append(f'{metric}{{{label}="{key}"}} {value:g}')
+        return "\n".join(out) + "\n"
+
+
+def _fmt_seconds(value: float) -> str:
+    if value == float("inf"):
+        return ">10s"
+    if value < 0.001:
+        return f"{value * 1e6:.0f}µs"
+    if value < 1:
+        return f"{value * 1e3:.1f}ms"
+    return f"{value:.2f}s"
+
+
+metrics = Metrics()
@@ -0,0 +1,231 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+from nonebot.log import logger
+
+from .accounts import ModerationBot
+from .metrics import metrics
+from .ratelimit import TokenBucket
+
+# Recall outcomes; only RETRY is attempted again
+RECALL_OK = "ok"
+RECALL_GONE = "gone"  # already recalled or deleted
+RECALL_TOO_OLD = "too_old"  # outside the recall time limit
+RECALL_RETRY = "retry"
+RECALL_FAILED = "failed"
+
+# Substrings of OneBot/NapCat error messages that make a retry pointless
+_GONE_MARKERS = ("不存在", "已撤回", "已被撤回", "not found", "not exist", "recalled", "no such")
+_TOO_OLD_MARKERS = ("超过", "过期", "too old", "expired", "time limit")
+# The action itself is missing (retcode 1404 is checked as well). Only
+# wording specific to that: a generic "未知错误" must not turn batching off
+_UNSUPPORTED_MARKERS = ("api_not_found", "api not found", "api不存在", "不支持的api", "unknown action", "unsupported action")
+
+
+class RecallResult(NamedTuple):
+    message_id: int
+    status: str
+    error: str = ""
+
+
+def _error_text(e: Exception) -> str:
+    info = getattr(e, "info", None)
+    if isinstance(info, dict):
+        parts = [str(info.get(key, "")) for key in ("retcode", "msg", "message", "wording")]
+        return " ".join(p for p in parts if p) or str(e)
+    return str(e)
+
+
+def classify_recall_error(e: Exception) -> str:
+    """Map a failed delete_msg to RECALL_GONE, RECALL_TOO_OLD or RECALL_RETRY."""
+    text = _error_text(e).lower()
+    if any(marker in text for marker in _GONE_MARKERS):
+        return RECALL_GONE
+    if any(marker in text for marker in _TOO_OLD_MARKERS):
+        return RECALL_TOO_OLD
+    return RECALL_RETRY
+
+
+def _is_unsupported(e: Exception) -> bool:
+    info = getattr(e, "info", None)
+    if isinstance(info, dict) and info.get("retcode") == 1404:
+        return True
+    text = _error_text(e).lower()
+    return any(marker in text for marker in _UNSUPPORTED_MARKERS)
+
+
+class _RecallBatch(NamedTuple):
+    bot: ModerationBot
+    message_ids: List[int]
+    attempt: int
+
+
+class RecallQueue:
+    """Global queue of recall batches (one per ban), drained by a pool of workers.
+
+    A batch goes out as a single ``batch_api`` call when one is configured and
+    the account supports it; otherwise its messages are recalled concurrently,
+    at most ``concurrency`` at a time, each taking a token from the account's
+    bucket. Message ids already queued or in flight are not queued twice, and
+    only transient failures are retried, with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        workers: int,
+        max_retries: int,
+        retry_delay: float,
+        concurrency: int = 3,
+        batch_api: str = "",
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.workers = max(workers, 1)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.concurrency = max(concurrency, 1)
+        self.batch_api = batch_api
+        # Called with every final RecallResult
+        self.listeners: List[Callable[[RecallResult], None]] = []
+        # Created lazily so it binds to the running loop (Python 3.9)
+        self._queue: "Optional[asyncio.Queue[_RecallBatch]]" = None
+        self._pending: Set[int] = set()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._batch_unsupported: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    def enqueue(self, bot: ModerationBot, message_ids: Iterable[int]) -> int:
+        """Queue a batch of recalls without waiting; returns how many were newly queued."""
+        batch = []
+        for mid in message_ids:
+            if mid in self._pending:
+                continue
+            self._pending.add(mid)
+            batch.append(mid)
+        if batch:
+            self._get_queue().put_nowait(_RecallBatch(bot, batch, 0))
+        return len(batch)
+
+    def _get_queue(self) -> "asyncio.Queue[_RecallBatch]":
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def join(self):
+        """Wait until everything queued so far has been attempted."""
+        await self._get_queue().join()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _bucket(self, bot: ModerationBot) -> TokenBucket:
+        bucket = self._buckets.get(bot.self_id)
+        if bucket is None:
+            bucket = self._buckets[bot.self_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def recall(self, bot: ModerationBot, message_ids: List[int]) -> List[RecallResult]:
+        """Recall a batch now and return one result per message."""
+        if self.batch_api and bot.self_id not in self._batch_unsupported:
+            results = await self._recall_batch_api(bot, message_ids)
+            if results is not None:
+                return results
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def recall_one(mid: int) -> RecallResult:
+            async with semaphore:
+                await self._bucket(bot).acquire()
+                start = time.perf_counter()
+                try:
+                    await bot.delete_msg(message_id=mid)
+                except Exception as e:
+                    return RecallResult(mid, classify_recall_error(e), _error_text(e))
+                finally:
+                    metrics.observe("stage_seconds", "recall", time.perf_counter() - start)
+                return RecallResult(mid, RECALL_OK)
+
+        return list(await asyncio.gather(*(recall_one(mid) for mid in message_ids)))
+
+    async def _recall_batch_api(self, bot: ModerationBot, message_ids: List[int]) -> Optional[List[RecallResult]]:
+        # One round trip for the whole batch; None means fall back to single calls
+        await self._bucket(bot).acquire()
+        start = time.perf_counter()
+        try:
+            response: Any = await bot.call_api(self.batch_api, message_ids=message_ids)
+        except Exception as e:
+            if _is_unsupported(e):
+                logger.info(f"Account {bot.self_id} has no {self.batch_api}, recalling one by one")
+                self._batch_unsupported.add(bot.self_id)
+                return None
+            status = classify_recall_error(e)
+            return [RecallResult(mid, status, _error_text(e)) for mid in message_ids]
+        finally:
+            metrics.observe("stage_seconds", "recall", time.perf_counter() - start)
+
+        # Per-message outcomes, if the implementation reports them
+        failed: Dict[int, str] = {}
+        if isinstance(response, dict):
+            for item in response.get("failed", []) or []:
+                if isinstance(item, dict) and "message_id" in item:
+                    failed[int(item["message_id"])] = str(item.get("error", ""))
+        results = []
+        for mid in message_ids:
+            if mid in failed:
+                error = RuntimeError(failed[mid])
+                results.append(RecallResult(mid, classify_recall_error(error), failed[mid]))
+            else:
+                results.append(RecallResult(mid, RECALL_OK))
+        return results
+
+    def _retry(self, batch: _RecallBatch):
+        self._get_queue().put_nowait(batch)
+
+    def _finish(self, result: RecallResult):
+        self._pending.discard(result.message_id)
+        metrics.inc("recalls", result.status, label_name="status")
+        for listener in self.listeners:
+            listener(result)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        queue = self._get_queue()
+        while True:
+            batch = await queue.get()
+            try:
+                results = await self.recall(batch.bot, batch.message_ids)
+                retry: List[int] = []
+                for result in results:
+                    if result.status == RECALL_RETRY and batch.attempt < self.max_retries:
+                        retry.append(result.message_id)
+                        continue
+                    if result.status == RECALL_RETRY:
+                        result = result._replace(status=RECALL_FAILED)
+                        logger.warning(f"Failed to recall message {result.message_id}: {result.error}")
+                    self._finish(result)
+                if retry:
+                    delay = self.retry_delay * (2 ** batch.attempt)
+                    logger.debug(f"Retrying recall of {len(retry)} message(s) in {delay:.1f}s")
+                    loop.call_later(delay, self._retry, _RecallBatch(batch.bot, retry, batch.attempt + 1))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Recall worker failed: {e}")
+                for mid in batch.message_ids:
+                    self._finish(RecallResult(mid, RECALL_FAILED, str(e)))
+            finally:
+                queue.task_done()
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from nonebot.log import logger
+
+from .accounts import ModerationBot
+from .metrics import metrics
+from .permissions import NOT_ADMIN, TARGET_ADMIN
+from .ratelimit import TokenBucket
+
+_BLOCKED_TEXT = {
+    NOT_ADMIN: "本账号不是管理员",
+    TARGET_ADMIN: "对方是管理员或群主",
+}
+
+
+class Notice(NamedTuple):
+    offender: int
+    reason: str
+    # Ban length in seconds; 0 for a ban that failed or was skipped
+    duration: int
+    # Why the ban was skipped without trying (see permissions), if it was
+    blocked: str = ""
+
+
+def compose(notices: List[Notice]) -> str:
+    """One group message covering every notice, in the order they came in."""
+    banned = [n for n in notices if n.duration > 0]
+    failed = list(dict.fromkeys(str(n.offender) for n in notices if n.duration <= 0 and not n.blocked))
+    blocked: Dict[str, List[str]] = {}
+    for n in notices:
+        if n.blocked:
+            blocked.setdefault(n.blocked, []).append(str(n.offender))
+    lines: List[str] = []
+    if len(banned) == 1:
+        n = banned[0]
+        lines.append(f"{n.reason}，已禁言 {n.offender} {n.duration//60}分钟，并撤回相关消息。")
+    elif banned:
+        offenders = list(dict.fromkeys(str(n.offender) for n in banned))
+        lines.append(f"已禁言 {', '.join(offenders)}，并撤回相关消息：")
+        by_reason: Dict[str, List[str]] = {}
+        for n in banned:
+            by_reason.setdefault(n.reason, []).append(f"{n.offender}（{n.duration//60}分钟）")
+        for reason, entries in by_reason.items():
+            lines.append(f"{reason}：{'、'.join(entries)}")
+    if failed:
+        lines.append(f"尝试禁言 {', '.join(failed)} 失败，请检查权限。")
+    for why, offenders in blocked.items():
+        offenders = list(dict.fromkeys(offenders))
+        lines.append(f"{', '.join(offenders)} 触发了检测，但{_BLOCKED_TEXT.get(why, '没有权限')}，无法禁言。")
+    return "\n".join(lines)
+
+
+class NoticeScheduler:
+    """Coalesces moderation notices per group and rate-limits what gets sent.
+
+    The first notice for a group opens a ``window`` second gathering period;
+    everything posted until the message actually goes out is sent together.
+    Sends take a token from the group's bucket and from a global one, and
+    wait (up to ``max_defer`` seconds) while ``busy`` reports moderation
+    calls still in flight, so bans and recalls go first.
+    """
+
+    def __init__(
+        self,
+        window: float = 2.0,
+        group_rate: float = 0.2,
+        group_burst: int = 1,
+        global_rate: float = 1.0,
+        global_burst: int = 3,
+        busy: Optional[Callable[[], bool]] = None,
+        max_defer: float = 5.0,
+    ):
+        self.window = window
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.busy = busy
+        self.max_defer = max_defer
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._buffers: Dict[int, List[Notice]] = {}
+        self._bots: Dict[int, ModerationBot] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def post(self, bot: ModerationBot, group_id: int, notice: Notice):
+        """Queue a notice for the group without waiting."""
+        self._buffers.setdefault(group_id, []).append(notice)
+        self._bots[group_id] = bot
+        if group_id not in self._tasks:
+            self._tasks[group_id] = asyncio.ensure_future(self._drain(group_id))
+
+    def pending(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
+
+    async def _wait_idle(self):
+        if self.busy is None:
+            return
+        deadline = time.monotonic() + self.max_defer
+        while self.busy() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+    def _bucket(self, group_id: int) -> TokenBucket:
+        bucket = self._buckets.get(group_id)
+        if bucket is None:
+            bucket = self._buckets[group_id] = TokenBucket(self.group_rate, self.group_burst)
+        return bucket
+
+    async def _drain(self, group_id: int):
+        try:
+            while self._buffers.get(group_id):
+                if self.window > 0:
+                    await asyncio.sleep(self.window)
+                await self._wait_idle()
+                await self._bucket(group_id).acquire()
+                await self._global.acquire()
+                # Whatever piled up while waiting goes out in this message
+                await self._send(group_id, self._buffers.pop(group_id, []))
+        finally:
+            self._tasks.pop(group_id, None)
+
+    async def _send(self, group_id: int, notices: List[Notice]):
+        if not notices:
+            return
+        metrics.inc("notices_sent")
+        metrics.inc("notices_coalesced", "", len(notices) - 1)
+        try:
+            await self._bots[group_id].send_group_msg(group_id=group_id, message=compose(notices))
+        except Exception as e:
+            logger.error(f"Failed to send notice to group {group_id}: {e}")
+
+    async def flush(self):
+        """Send everything buffered now, ignoring the window, limits and busy check."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        for group_id in list(self._buffers):
+            await self._send(group_id, self._buffers.pop(group_id))
@@ -0,0 +1,101 @@
+import json
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+from nonebot.log import logger
+
+from .persistence import WriteBehindFile
+
+OFFENDER_FILE = Path("offenders.json")
+
+# Entries whose decayed count falls below this are forgotten by sweep()
+_FORGET_BELOW = 0.05
+
+
+class OffenderIndex:
+    """Decaying offense counts per (group_id, bot_qq), for escalating bans.
+
+    Each entry is ``(count, last offense time)``. The count halves every
+    ``half_life`` seconds without a new offense, so a bot that behaves for a
+    while drifts back towards the base ban. The file is read on first use,
+    written behind on change, and faded entries are dropped by ``sweep``.
+    """
+
+    def __init__(self, half_life: float, path: Optional[Path] = OFFENDER_FILE):
+        self.half_life = half_life
+        self.path = path
+        self._entries: Optional[Dict[Tuple[int, int], Tuple[float, float]]] = None
+        self._store = WriteBehindFile(path, self._snapshot) if path else None
+
+    @property
+    def entries(self) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def level(self, group_id: int, bot_id: int, now: float) -> float:
+        """Offense count decayed to ``now``; 0 for bots with no record."""
+        entry = self.entries.get((group_id, bot_id))
+        if entry is None:
+            return 0.0
+        count, last = entry
+        if self.half_life <= 0:
+            return count
+        return count * 0.5 ** (max(now - last, 0.0) / self.half_life)
+
+    def ban_duration(self, group_id: int, bot_id: int, now: float, base: int, multiplier: float, cap: int) -> int:
+        """Ban length for a new offense: ``base * multiplier ** previous``, at most ``cap``."""
+        previous = self.level(group_id, bot_id, now)
+        if multiplier <= 1 or previous <= 0:
+            return min(base, cap) if cap > 0 else base
+        duration = base * multiplier ** previous
+        if cap > 0:
+            duration = min(duration, cap)
+        return int(duration)
+
+    def record(self, group_id: int, bot_id: int, now: float) -> float:
+        """Count a new offense and return the resulting level."""
+        count = self.level(group_id, bot_id, now) + 1
+        self.entries[(group_id, bot_id)] = (count, now)
+        if self._store:
+            self._store.mark_dirty()
+        return count
+
+    def groups(self, since: float) -> Set[int]:
+        """Groups with an offense recorded at or after ``since``."""
+        return {group_id for (group_id, _), (_, last) in self.entries.items() if last >= since}
+
+    def sweep(self, now: float) -> int:
+        """Forget offenders whose count has decayed away; returns how many."""
+        if self._entries is None or self.half_life <= 0:
+            return 0
+        faded = [key for key in self._entries if self.level(key[0], key[1], now) < _FORGET_BELOW]
+        for key in faded:
+            del self._entries[key]
+        if faded and self._store:
+            self._store.mark_dirty()
+        return len(faded)
+
+    async def flush(self):
+        if self._store:
+            await self._store.flush()
+
+    def _snapshot(self) -> dict:
+        groups: Dict[str, Dict[str, list]] = {}
+        for (group_id, bot_id), (count, last) in self.entries.items():
+            groups.setdefault(str(group_id), {})[str(bot_id)] = [round(count, 4), last]
+        return {"offenders": groups}
+
+    def _load(self) -> Dict[Tuple[int, int], Tuple[float, float]]:
+        entries: Dict[Tuple[int, int], Tuple[float, float]] = {}
+        if not self.path or not self.path.exists():
+            return entries
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for group_id, bots in data.get("offenders", {}).items():
+                for bot_id, (count, last) in bots.items():
+                    entries[(int(group_id), int(bot_id))] = (float(count), float(last))
+        except Exception as e:
+            logger.error(f"Error loading offenders: {e}")
+        return entries
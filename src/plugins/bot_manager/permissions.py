@@ -0,0 +1,135 @@
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from nonebot.log import logger
+
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from .accounts import ModerationBot
+
+# Why a ban can't work, as reported by PermissionCache.blocker
+NOT_ADMIN = "not_admin"
+TARGET_ADMIN = "target_admin"
+
+_STAFF = ("admin", "owner")
+
+
+def can_ban(actor_role: Optional[str], target_role: Optional[str]) -> bool:
+    """Whether ``actor_role`` can mute ``target_role``; unknown roles get the benefit of the doubt."""
+    if actor_role is not None and actor_role not in _STAFF:
+        return False
+    # Admins can only mute members; the owner can mute admins; nobody mutes the owner
+    if target_role == "owner":
+        return False
+    return not (target_role == "admin" and actor_role == "admin")
+
+
+class PermissionCache:
+    """Group roles (member/admin/owner) as of the last lookup, kept for ``ttl`` seconds.
+
+    Single users are looked up with ``get_group_member_info`` when first
+    needed. ``warm`` loads whole groups from ``get_group_member_list``
+    instead; only their admins and owner are stored, since everyone else on
+    the list is a member. ``group_admin`` notices update entries in place,
+    so a promotion or demotion is picked up before the TTL runs out.
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        # group -> (loaded at, admins and owner of the group)
+        self._groups: Dict[int, Tuple[float, Dict[int, str]]] = {}
+        # (group, user) -> (looked up at, role)
+        self._users: Dict[Tuple[int, int], Tuple[float, str]] = {}
+
+    def get(self, group_id: int, user_id: int, now: float) -> Optional[str]:
+        """The cached role, or None if unknown or expired."""
+        entry = self._users.get((group_id, user_id))
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        group = self._groups.get(group_id)
+        if group is not None and now - group[0] < self.ttl:
+            return group[1].get(user_id, "member")
+        return None
+
+    def put(self, group_id: int, user_id: int, role: str, now: float):
+        self._users[(group_id, user_id)] = (now, role)
+        group = self._groups.get(group_id)
+        if group is not None:
+            if role in _STAFF:
+                group[1][user_id] = role
+            else:
+                group[1].pop(user_id, None)
+
+    def put_members(self, group_id: int, members: Iterable[Dict[str, Any]], now: float):
+        """Replace everything known about the group with a full member list."""
+        staff = {int(m["user_id"]): m["role"] for m in members if m.get("role") in _STAFF}
+        self._groups[group_id] = (now, staff)
+        for key in [key for key in self._users if key[0] == group_id]:
+            del self._users[key]
+
+    def invalidate(self, group_id: int):
+        self._groups.pop(group_id, None)
+        for key in [key for key in self._users if key[0] == group_id]:
+            del self._users[key]
+
+    def sweep(self, now: float):
+        for group_id in [g for g, (loaded, _) in self._groups.items() if now - loaded >= self.ttl]:
+            del self._groups[group_id]
+        for key in [key for key, (seen, _) in self._users.items() if now - seen >= self.ttl]:
+            del self._users[key]
+
+    async def lookup(self, bot: "ModerationBot", group_id: int, user_id: int, now: float) -> Optional[str]:
+        """The user's role, asking the server on a miss; None if that fails too."""
+        role = self.get(group_id, user_id, now)
+        if role is not None:
+            metrics.inc("permission_lookups", "hit", label_name="result")
+            return role
+        metrics.inc("permission_lookups", "miss", label_name="result")
+        try:
+            info = await bot.call_api("get_group_member_info", group_id=group_id, user_id=user_id, no_cache=True)
+        except Exception as e:
+            logger.warning(f"Could not read role of {user_id} in group {group_id}: {e}")
+            return None
+        role = info.get("role") or "member"
+        self.put(group_id, user_id, role, now)
+        return role
+
+    async def blocker(
+        self, bot: "ModerationBot", group_id: int, target: int, actors: Sequence[int], now: float
+    ) -> str:
+        """Why none of our ``actors`` can ban ``target`` (NOT_ADMIN, TARGET_ADMIN), or "" if one can.
+
+        Unknown roles count as able to, so the ban is still tried.
+        """
+        target_role, *actor_roles = await asyncio.gather(
+            self.lookup(bot, group_id, target, now),
+            *(self.lookup(bot, group_id, actor, now) for actor in actors),
+        )
+        if any(can_ban(role, target_role) for role in actor_roles):
+            return ""
+        if all(role is not None and role not in _STAFF for role in actor_roles):
+            return NOT_ADMIN
+        return TARGET_ADMIN
+
+    def allows(self, group_id: int, actor: int, target: int, now: float) -> bool:
+        """``can_ban`` on cached roles only, without asking the server."""
+        return can_ban(self.get(group_id, actor, now), self.get(group_id, target, now))
+
+    async def warm(self, bot: "ModerationBot", group_ids: Iterable[int], now: float, pause: float = 0.1):
+        """Load the member lists of ``group_ids`` not already cached, one call per group."""
+        for group_id in group_ids:
+            loaded = self._groups.get(group_id)
+            if loaded is not None and now - loaded[0] < self.ttl:
+                continue
+            try:
+                members = await bot.call_api("get_group_member_list", group_id=group_id, no_cache=True)
+            except Exception as e:
+                logger.warning(f"Could not load members of group {group_id}: {e}")
+                continue
+            self.put_members(group_id, members, now)
+            # Spread the lists out rather than bursting them at the server
+            await asyncio.sleep(pause)
+
+    def __len__(self) -> int:
+        return len(self._groups)
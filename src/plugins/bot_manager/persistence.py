@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from nonebot.log import logger
+
+# Read once at import: os.umask can only be read by setting it, which isn't
+# safe from the worker threads writes run on
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path: Path) -> int:
+    """``path``'s permission bits, or what a plain open() would give a new file."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """Write to a temp file next to ``path`` and rename it over the original.
+
+    The temp file is private (0600) while it is written; it takes the
+    original's mode before the rename, so the file keeps its permissions.
+    """
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_name, _file_mode(path))
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path: Path, data: Any):
+    """Write JSON to ``path`` atomically (see ``atomic_write_bytes``)."""
+    atomic_write_bytes(path, json.dumps(data, indent=4).encode("utf-8"))
+
+
+class WriteBehindFile:
+    """Coalesces changes to a JSON file and writes them off the event loop.
+
+    ``mark_dirty`` schedules a single flush ``delay`` seconds later, however
+    many changes happen in between. The data is captured on the loop thread by
+    calling ``snapshot`` and written in a worker thread via ``atomic_write_json``.
+    Outside a running loop, ``mark_dirty`` writes immediately.
+    """
+
+    def __init__(self, path: Path, snapshot: Callable[[], Any], delay: float = 1.0):
+        self.path = path
+        self.snapshot = snapshot
+        self.delay = delay
+        self.dirty = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._lock: Optional[asyncio.Lock] = None
+        # The loop only keeps a weak reference to tasks, so hold on to it
+        self._task: Optional["asyncio.Future[None]"] = None
+
+    def mark_dirty(self):
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self._handle is None:
+            self._handle = loop.call_later(self.delay, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._handle = None
+        self._task = asyncio.ensure_future(self._flush())
+        self._task.add_done_callback(self._clear_task)
+
+    def _clear_task(self, task: "asyncio.Future[None]"):
+        if self._task is task:
+            self._task = None
+
+    async def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        # Let a scheduled flush that is already running finish first
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        await self._flush()
+
+    async def _flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            data = self.snapshot()
+            try:
+                await asyncio.to_thread(atomic_write_json, self.path, data)
+            except Exception as e:
+                self.dirty = True
+                logger.error(f"Error saving {self.path}: {e}")
+
+    def flush_sync(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            atomic_write_json(self.path, self.snapshot())
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Error saving {self.path}: {e}")
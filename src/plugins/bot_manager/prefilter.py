@@ -0,0 +1,39 @@
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from .storage import GLOBAL_SCOPE
+
+
+class MonitorFilter:
+    """Precomputed (group, sender) gate for the monitor matcher.
+
+    ``rebuild`` flattens the enabled groups and monitored bot lists into
+    frozensets and swaps them in as one tuple; ``matches`` is then a couple of
+    set lookups with no locking. Call ``rebuild`` whenever the bot list or
+    the group configuration changes.
+    """
+
+    __slots__ = ("_snapshot",)
+
+    def __init__(self):
+        self._snapshot: Tuple[Optional[FrozenSet[int]], FrozenSet[int], FrozenSet[Tuple[int, int]]] = (
+            None,
+            frozenset(),
+            frozenset(),
+        )
+
+    def rebuild(self, enabled_groups: Iterable[int], scopes: Dict[int, Set[int]]):
+        groups = frozenset(enabled_groups) or None
+        global_bots = frozenset(scopes.get(GLOBAL_SCOPE, ()))
+        group_bots = frozenset(
+            (group_id, qq)
+            for group_id, bots in scopes.items()
+            if group_id != GLOBAL_SCOPE and (groups is None or group_id in groups)
+            for qq in bots
+        )
+        self._snapshot = (groups, global_bots, group_bots)
+
+    def matches(self, group_id: int, user_id: int) -> bool:
+        groups, global_bots, group_bots = self._snapshot
+        if groups is not None and group_id not in groups:
+            return False
+        return user_id in global_bots or (group_id, user_id) in group_bots
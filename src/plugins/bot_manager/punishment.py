@@ -0,0 +1,61 @@
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+
+class PunishState(Enum):
+    IN_FLIGHT = "in_flight"
+    PUNISHED = "punished"
+
+
+class PunishmentTable:
+    """Per-(group, sender) ban state, so one offender is only acted on once.
+
+    ``begin`` claims the offender while the ban call is in flight; a success
+    keeps them marked as punished for ``ttl`` seconds, a failure releases the
+    claim so the next trigger retries.
+    """
+
+    def __init__(self, ttl: float, in_flight_timeout: float = 30):
+        self.ttl = ttl
+        self.in_flight_timeout = in_flight_timeout
+        self.entries: Dict[Tuple[int, int], Tuple[PunishState, float]] = {}
+        self.failures = 0
+
+    def state(self, group_id: int, sender_id: int, now: float) -> Optional[PunishState]:
+        key = (group_id, sender_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        state, expires = entry
+        if now >= expires:
+            del self.entries[key]
+            return None
+        return state
+
+    def is_active(self, group_id: int, sender_id: int, now: float) -> bool:
+        return self.state(group_id, sender_id, now) is not None
+
+    def begin(self, group_id: int, sender_id: int, now: float) -> bool:
+        """Claim the offender; returns False if a ban is in flight or still active."""
+        if self.is_active(group_id, sender_id, now):
+            return False
+        self.entries[(group_id, sender_id)] = (
+            PunishState.IN_FLIGHT,
+            now + self.in_flight_timeout,
+        )
+        return True
+
+    def succeed(self, group_id: int, sender_id: int, now: float, duration: Optional[float] = None):
+        ttl = self.ttl if duration is None else duration
+        self.entries[(group_id, sender_id)] = (PunishState.PUNISHED, now + ttl)
+
+    def fail(self, group_id: int, sender_id: int):
+        self.failures += 1
+        self.entries.pop((group_id, sender_id), None)
+
+    def sweep(self, now: float) -> int:
+        """Drop expired entries; returns how many were removed."""
+        expired = [key for key, (_, expires) in self.entries.items() if now >= expires]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
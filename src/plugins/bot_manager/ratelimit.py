@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket limiter; ``acquire`` waits until a token is available.
+
+    Tokens are reserved up front (the balance may go negative), so concurrent
+    callers queue up behind each other without needing a lock.
+    """
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def delay(self) -> float:
+        """Seconds until a token would be available, without reserving one."""
+        tokens = self._refill()
+        if tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - tokens) / self.rate
+
+    async def acquire(self):
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0 and self.rate > 0:
+            await asyncio.sleep(-self.tokens / self.rate)
@@ -0,0 +1,125 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from nonebot.log import logger
+
+from .metrics import metrics
+
+# What submit() does when a shard's queue is full
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+# Wait up to block_timeout for room (slows the sender's handler), then drop
+BLOCK = "block"
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class ShardedDispatcher:
+    """Runs per-group jobs on a fixed set of worker tasks, one per shard.
+
+    A group always maps to the same shard and each shard runs its jobs one at
+    a time, so messages from one group are processed in arrival order while a
+    busy group only holds up the groups that share its shard. Each shard's
+    queue holds at most ``maxsize`` jobs; ``policy`` decides what happens when
+    it is full. Before ``start`` (or after ``stop``) jobs run inline.
+    """
+
+    def __init__(self, shards: int, maxsize: int, policy: str = DROP_OLDEST, block_timeout: float = 1.0):
+        self.shards = max(shards, 1)
+        self.maxsize = max(maxsize, 1)
+        if policy not in POLICIES:
+            logger.warning(f"Unknown shard queue policy '{policy}', using {DROP_OLDEST}")
+            policy = DROP_OLDEST
+        self.policy = policy
+        self.block_timeout = block_timeout
+        # Created in start() so they bind to the running loop (Python 3.9)
+        self._queues: List["asyncio.Queue[Tuple[int, Job]]"] = []
+        self._tasks: List[asyncio.Task] = []
+        # Queued jobs per group, to tell which groups are hot
+        self._pending: Dict[int, int] = {}
+
+    def shard_of(self, group_id: int) -> int:
+        return group_id % self.shards
+
+    async def submit(self, group_id: int, job: Job) -> bool:
+        """Queue ``job`` on the group's shard; False if it (or nothing) had to be dropped."""
+        if not self._tasks:
+            await job()
+            return True
+
+        shard = self.shard_of(group_id)
+        queue = self._queues[shard]
+        if queue.full():
+            if self.policy == DROP_NEWEST:
+                metrics.inc("shard_dropped", DROP_NEWEST, label_name="policy")
+                return False
+            if self.policy == DROP_OLDEST:
+                dropped_group, _ = queue.get_nowait()
+                queue.task_done()
+                self._done(dropped_group)
+                metrics.inc("shard_dropped", DROP_OLDEST, label_name="policy")
+            else:
+                try:
+                    await asyncio.wait_for(queue.put((group_id, job)), self.block_timeout)
+                except asyncio.TimeoutError:
+                    metrics.inc("shard_dropped", BLOCK, label_name="policy")
+                    return False
+                self._pending[group_id] = self._pending.get(group_id, 0) + 1
+                return True
+
+        queue.put_nowait((group_id, job))
+        self._pending[group_id] = self._pending.get(group_id, 0) + 1
+        return True
+
+    def _done(self, group_id: int):
+        left = self._pending.get(group_id, 0) - 1
+        if left > 0:
+            self._pending[group_id] = left
+        else:
+            self._pending.pop(group_id, None)
+
+    async def _worker(self, queue: "asyncio.Queue[Tuple[int, Job]]"):
+        while True:
+            group_id, job = await queue.get()
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Detection job for group {group_id} failed: {e}")
+            finally:
+                self._done(group_id)
+                queue.task_done()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queues = [asyncio.Queue(self.maxsize) for _ in range(self.shards)]
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self, timeout: float = 5.0):
+        """Let queued jobs finish for up to ``timeout`` seconds, then cancel the workers."""
+        if self._queues:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._queues)), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {sum(q.qsize() for q in self._queues)} queued detection jobs on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        self._pending.clear()
+
+    def depths(self) -> Dict[str, float]:
+        """Queued jobs per shard."""
+        return {str(shard): queue.qsize() for shard, queue in enumerate(self._queues)}
+
+    def hot_groups(self, limit: int = 5) -> Dict[str, float]:
+        """The groups with the most queued jobs."""
+        top = sorted(self._pending.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return {str(group_id): count for group_id, count in top}
+
+    def pending(self, group_id: Optional[int] = None) -> int:
+        if group_id is not None:
+            return self._pending.get(group_id, 0)
+        return sum(self._pending.values())
@@ -0,0 +1,152 @@
+import asyncio
+import struct
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .persistence import atomic_write_bytes
+from .punishment import PunishmentTable, PunishState
+from .window import Columns, SlidingWindow
+
+SNAPSHOT_FILE = Path("detection.snap")
+
+# File: header, then one zlib stream of
+#   punishment count, per punishment: _PUNISHMENT
+#   sender count, per sender: _SENDER + message columns + interaction columns
+# Columns are the raw little-endian array('d') timestamps and array('q') ids.
+_MAGIC = b"FOBS"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHd")  # magic, version, saved at
+_COUNT = struct.Struct("<I")
+_SENDER = struct.Struct("<qqII")  # group, sender, messages, interactions
+_PUNISHMENT = struct.Struct("<qqd")  # group, sender, expires at
+
+_SWAP = sys.byteorder != "little"
+
+
+def _pack_column(column: array) -> bytes:
+    if _SWAP:
+        column.byteswap()
+    return column.tobytes()
+
+
+def _unpack_column(typecode: str, data: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if _SWAP:
+        column.byteswap()
+    return column
+
+
+def capture(window: SlidingWindow, punishments: PunishmentTable, now: float) -> List[bytes]:
+    """Uncompressed snapshot pieces; only copies memory, so it is cheap on the loop thread."""
+    pieces: List[bytes] = [_HEADER.pack(_MAGIC, _VERSION, now)]
+    banned = [
+        (key, expires)
+        for key, (state, expires) in punishments.entries.items()
+        if state is PunishState.PUNISHED and expires > now
+    ]
+    pieces.append(_COUNT.pack(len(banned)))
+    for (group_id, sender_id), expires in banned:
+        pieces.append(_PUNISHMENT.pack(group_id, sender_id, expires))
+
+    count_index = len(pieces)
+    pieces.append(b"")
+    senders = 0
+    for group_id, sender_id, messages, interactions in window.export():
+        pieces.append(_SENDER.pack(group_id, sender_id, len(messages[0]), len(interactions[0])))
+        for column in (*messages, *interactions):
+            pieces.append(_pack_column(column))
+        senders += 1
+    pieces[count_index] = _COUNT.pack(senders)
+    return pieces
+
+
+def write(path: Path, pieces: List[bytes]):
+    """Compress and atomically write captured pieces; meant for a worker thread."""
+    atomic_write_bytes(path, pieces[0] + zlib.compress(b"".join(pieces[1:]), 1))
+
+
+def read(path: Path) -> Tuple[float, bytes]:
+    """(saved at, decompressed body) of a snapshot file."""
+    data = path.read_bytes()
+    magic, version, saved_at = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"not a version {_VERSION} snapshot")
+    return saved_at, zlib.decompress(data[_HEADER.size:])
+
+
+def restore(
+    body: bytes,
+    window: SlidingWindow,
+    punishments: PunishmentTable,
+    now: float,
+    budget: float,
+) -> Dict[str, int]:
+    """Load a snapshot body into empty(ish) state, skipping expired entries.
+
+    Stops restoring windows once ``budget`` seconds have passed, so startup
+    stays quick however many groups the snapshot holds.
+    """
+    deadline = time.perf_counter() + budget
+    stats = {"senders": 0, "expired": 0, "skipped": 0, "punishments": 0}
+    offset = 0
+    (banned,) = _COUNT.unpack_from(body, offset)
+    offset += _COUNT.size
+    for _ in range(banned):
+        group_id, sender_id, expires = _PUNISHMENT.unpack_from(body, offset)
+        offset += _PUNISHMENT.size
+        if expires > now and (group_id, sender_id) not in punishments.entries:
+            punishments.entries[(group_id, sender_id)] = (PunishState.PUNISHED, expires)
+            stats["punishments"] += 1
+
+    (senders,) = _COUNT.unpack_from(body, offset)
+    offset += _COUNT.size
+    for index in range(senders):
+        if time.perf_counter() > deadline:
+            stats["skipped"] = senders - index
+            break
+        group_id, sender_id, message_count, interaction_count = _SENDER.unpack_from(body, offset)
+        offset += _SENDER.size
+        columns: List[array] = []
+        for typecode, count in (("d", message_count), ("q", message_count), ("d", interaction_count), ("q", interaction_count)):
+            size = count * 8
+            columns.append(_unpack_column(typecode, body[offset:offset + size]))
+            offset += size
+        messages: Columns = (columns[0], columns[1])
+        interactions: Columns = (columns[2], columns[3])
+        if window.restore(group_id, sender_id, messages, interactions, now):
+            stats["senders"] += 1
+        else:
+            stats["expired"] += 1
+    return stats
+
+
+class SnapshotFile:
+    """Periodic and shutdown-time snapshots of a process-local detection state."""
+
+    def __init__(self, path: Path, window: SlidingWindow, punishments: PunishmentTable):
+        self.path = path
+        self.window = window
+        self.punishments = punishments
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def save(self, now: float):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            pieces = capture(self.window, self.punishments, now)
+            await asyncio.to_thread(write, self.path, pieces)
+
+    async def load(self, now: float, budget: float) -> Dict[str, int]:
+        """Restore the last snapshot, if any; empty stats when there is none."""
+        if not self.path.exists():
+            return {}
+        saved_at, body = await asyncio.to_thread(read, self.path)
+        # Anything older than the history window is gone anyway
+        if now - saved_at > self.window.history_window:
+            return {"senders": 0}
+        return restore(body, self.window, self.punishments, now, budget)
@@ -0,0 +1,417 @@
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Union
+
+from nonebot.log import logger
+
+from .punishment import PunishmentTable
+from .window import SenderWindow, SlidingWindow
+
+STATE_DB_FILE = Path("detection.db")
+
+
+class FixedSeries:
+    """Window contents fetched from a shared backend, shaped like a local series."""
+
+    __slots__ = ("ids",)
+
+    def __init__(self, ids: Sequence[int]):
+        self.ids = list(ids)
+
+    def recent_ids(self) -> List[int]:
+        return list(dict.fromkeys(self.ids))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class FixedWindow:
+    __slots__ = ("interactions", "messages")
+
+    def __init__(self, message_ids: Sequence[int], interaction_ids: Sequence[int]):
+        self.messages = FixedSeries(message_ids)
+        self.interactions = FixedSeries(interaction_ids)
+
+
+class DetectionState(ABC):
+    """Sliding windows and punishment markers used by handle_monitor.
+
+    ``observe`` records a message and returns the sender's window, whose
+    ``messages``/``interactions`` support ``len()`` and ``recent_ids()``.
+    ``claim`` atomically marks an offender as being banned, so only one caller
+    (or one process, for shared backends) acts on a trigger.
+    """
+
+    @abstractmethod
+    async def observe(
+        self,
+        group_id: int,
+        sender_id: int,
+        message_id: int,
+        targets: Sequence[int],
+        now: float,
+    ) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def peek(self, group_id: int, sender_id: int, now: float) -> Any:
+        """The sender's current window, without recording a message."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def is_punished(self, group_id: int, sender_id: int, now: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, group_id: int, sender_id: int, now: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def mark_punished(self, group_id: int, sender_id: int, now: float, duration: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, group_id: int, sender_id: int):
+        raise NotImplementedError
+
+    async def sweep(self, now: float, limit: int) -> bool:
+        """Expire old entries in bounded slices; True once a full pass is done."""
+        return True
+
+    def resize(self, detection_window: float, history_window: float):
+        """Use new window lengths from the next call on; expired entries stay gone."""
+        self.detection_window = detection_window
+        self.history_window = max(history_window, detection_window)
+
+    def stats(self) -> Dict[str, int]:
+        """Sizes of locally held state, for metrics; empty for shared backends."""
+        return {}
+
+    async def close(self):
+        pass
+
+
+class MemoryDetectionState(DetectionState):
+    """Process-local state (the default)."""
+
+    def __init__(self, detection_window: float, history_window: float, ban_duration: float):
+        self.window = SlidingWindow(detection_window, history_window)
+        self.punishments = PunishmentTable(ban_duration)
+
+    async def observe(self, group_id, sender_id, message_id, targets, now) -> SenderWindow:
+        return self.window.observe(group_id, sender_id, message_id, targets, now)
+
+    async def peek(self, group_id, sender_id, now) -> Any:
+        window = self.window.peek(group_id, sender_id, now)
+        return window if window is not None else FixedWindow((), ())
+
+    async def is_punished(self, group_id, sender_id, now) -> bool:
+        return self.punishments.is_active(group_id, sender_id, now)
+
+    async def claim(self, group_id, sender_id, now) -> bool:
+        return self.punishments.begin(group_id, sender_id, now)
+
+    async def mark_punished(self, group_id, sender_id, now, duration):
+        self.punishments.succeed(group_id, sender_id, now, duration)
+
+    async def release(self, group_id, sender_id):
+        self.punishments.fail(group_id, sender_id)
+
+    def resize(self, detection_window, history_window):
+        self.window.resize(detection_window, history_window)
+
+    async def sweep(self, now, limit) -> bool:
+        done = self.window.sweep(now, limit)
+        if done:
+            self.punishments.sweep(now)
+        return done
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.window.stats()
+        stats["punishments"] = len(self.punishments.entries)
+        return stats
+
+
+class SqliteDetectionState(DetectionState):
+    """State in a WAL-mode SQLite file that several processes can share.
+
+    Every operation runs in one ``BEGIN IMMEDIATE`` transaction in a worker
+    thread. Rows are unique per (group, sender, message, target), so two
+    processes recording the same event count it once.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        detection_window: float,
+        history_window: float,
+        in_flight_timeout: float = 30,
+    ):
+        self.detection_window = detection_window
+        self.history_window = max(history_window, detection_window)
+        self.in_flight_timeout = in_flight_timeout
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            str(path), isolation_level=None, check_same_thread=False, timeout=5
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS window_events (
+                group_id INTEGER NOT NULL,
+                sender_id INTEGER NOT NULL,
+                target_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                UNIQUE (group_id, sender_id, message_id, target_id)
+            );
+            CREATE INDEX IF NOT EXISTS window_events_sender
+                ON window_events (group_id, sender_id, ts);
+            CREATE INDEX IF NOT EXISTS window_events_ts ON window_events (ts);
+            CREATE TABLE IF NOT EXISTS punishments (
+                group_id INTEGER NOT NULL,
+                sender_id INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (group_id, sender_id)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def _run(self, func, *args):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(*args)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    async def _call(self, func, *args):
+        return await asyncio.to_thread(self._run, func, *args)
+
+    def _observe(self, group_id, sender_id, message_id, targets, now):
+        rows = [(group_id, sender_id, 0, message_id, now)]
+        rows.extend((group_id, sender_id, target, message_id, now) for target in targets)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO window_events VALUES (?, ?, ?, ?, ?)", rows
+        )
+        self.conn.execute(
+            "DELETE FROM window_events WHERE group_id = ? AND sender_id = ? AND ts < ?",
+            (group_id, sender_id, now - self.history_window),
+        )
+        return self._peek(group_id, sender_id, now)
+
+    def _peek(self, group_id, sender_id, now):
+        message_ids: List[int] = []
+        interaction_ids: List[int] = []
+        for mid, target in self.conn.execute(
+            "SELECT message_id, target_id FROM window_events"
+            " WHERE group_id = ? AND sender_id = ? AND ts >= ? ORDER BY ts",
+            (group_id, sender_id, now - self.detection_window),
+        ):
+            (interaction_ids if target else message_ids).append(mid)
+        return FixedWindow(message_ids, interaction_ids)
+
+    async def observe(self, group_id, sender_id, message_id, targets, now) -> FixedWindow:
+        return await self._call(self._observe, group_id, sender_id, message_id, list(targets), now)
+
+    async def peek(self, group_id, sender_id, now) -> FixedWindow:
+        return await self._call(self._peek, group_id, sender_id, now)
+
+    def _is_punished(self, group_id, sender_id, now):
+        row = self.conn.execute(
+            "SELECT 1 FROM punishments WHERE group_id = ? AND sender_id = ? AND expires > ?",
+            (group_id, sender_id, now),
+        ).fetchone()
+        return row is not None
+
+    async def is_punished(self, group_id, sender_id, now) -> bool:
+        return await self._call(self._is_punished, group_id, sender_id, now)
+
+    def _claim(self, group_id, sender_id, now):
+        self.conn.execute(
+            "DELETE FROM punishments WHERE group_id = ? AND sender_id = ? AND expires <= ?",
+            (group_id, sender_id, now),
+        )
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO punishments VALUES (?, ?, 'in_flight', ?)",
+            (group_id, sender_id, now + self.in_flight_timeout),
+        )
+        return cursor.rowcount == 1
+
+    async def claim(self, group_id, sender_id, now) -> bool:
+        return await self._call(self._claim, group_id, sender_id, now)
+
+    def _mark_punished(self, group_id, sender_id, expires):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO punishments VALUES (?, ?, 'punished', ?)",
+            (group_id, sender_id, expires),
+        )
+
+    async def mark_punished(self, group_id, sender_id, now, duration):
+        await self._call(self._mark_punished, group_id, sender_id, now + duration)
+
+    def _release(self, group_id, sender_id):
+        self.conn.execute(
+            "DELETE FROM punishments WHERE group_id = ? AND sender_id = ?",
+            (group_id, sender_id),
+        )
+
+    async def release(self, group_id, sender_id):
+        await self._call(self._release, group_id, sender_id)
+
+    def _sweep(self, now, limit):
+        cursor = self.conn.execute(
+            "DELETE FROM window_events WHERE rowid IN"
+            " (SELECT rowid FROM window_events WHERE ts < ? LIMIT ?)",
+            (now - self.history_window, limit),
+        )
+        if cursor.rowcount < limit:
+            self.conn.execute("DELETE FROM punishments WHERE expires <= ?", (now,))
+            return True
+        return False
+
+    async def sweep(self, now, limit) -> bool:
+        return await self._call(self._sweep, now, limit)
+
+    async def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# Records one message and returns the ids still inside the detection window.
+# KEYS: message zset, interaction zset
+# ARGV: now, detection_start, history_start, ttl, message_id, target ids...
+_OBSERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+redis.call('ZADD', KEYS[1], now, ARGV[5])
+for i = 6, #ARGV do
+    redis.call('ZADD', KEYS[2], now, ARGV[5] .. ':' .. ARGV[i])
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. ARGV[3])
+    redis.call('EXPIRE', key, ARGV[4])
+end
+return {
+    redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[2], '+inf'),
+    redis.call('ZRANGEBYSCORE', KEYS[2], ARGV[2], '+inf'),
+}
+"""
+
+
+def _member_id(member: Union[bytes, str]) -> int:
+    # Interaction members are "<message_id>:<target_id>"
+    if isinstance(member, bytes):
+        member = member.decode()
+    return int(member.split(":", 1)[0])
+
+
+class RedisDetectionState(DetectionState):
+    """State in Redis: one ZSET per (group, sender) window, updated by a Lua script.
+
+    Needs the optional ``redis`` package (``pip install redis``); any client
+    with the ``redis.asyncio`` interface can be passed in instead of a URL,
+    e.g. ``fakeredis.aioredis.FakeRedis()``. Keys expire on their own, so
+    there is nothing to sweep.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        detection_window: float,
+        history_window: float,
+        in_flight_timeout: float = 30,
+        prefix: str = "fob",
+        client: Any = None,
+    ):
+        if client is None:
+            try:
+                from redis import asyncio as aioredis
+            except ImportError as e:
+                raise RuntimeError("DETECTION_BACKEND=redis requires the 'redis' package") from e
+            client = aioredis.from_url(url)
+        self.client = client
+        self.detection_window = detection_window
+        self.history_window = max(history_window, detection_window)
+        self.in_flight_timeout = in_flight_timeout
+        self.prefix = prefix
+        self._observe = client.register_script(_OBSERVE_SCRIPT)
+
+    def _window_keys(self, group_id: int, sender_id: int) -> List[str]:
+        # Hash tag keeps both keys on one slot for Redis Cluster
+        base = f"{self.prefix}:w:{{{group_id}:{sender_id}}}"
+        return [f"{base}:m", f"{base}:i"]
+
+    def _punish_key(self, group_id: int, sender_id: int) -> str:
+        return f"{self.prefix}:p:{group_id}:{sender_id}"
+
+    async def observe(self, group_id, sender_id, message_id, targets, now) -> FixedWindow:
+        messages, interactions = await self._observe(
+            keys=self._window_keys(group_id, sender_id),
+            args=[
+                now,
+                now - self.detection_window,
+                now - self.history_window,
+                int(self.history_window) + 1,
+                message_id,
+                *targets,
+            ],
+        )
+        return FixedWindow(
+            [_member_id(member) for member in messages],
+            [_member_id(member) for member in interactions],
+        )
+
+    async def peek(self, group_id, sender_id, now) -> FixedWindow:
+        detection_start = now - self.detection_window
+        pipe = self.client.pipeline(transaction=False)
+        for key in self._window_keys(group_id, sender_id):
+            pipe.zrangebyscore(key, detection_start, "+inf")
+        messages, interactions = await pipe.execute()
+        return FixedWindow(
+            [_member_id(member) for member in messages],
+            [_member_id(member) for member in interactions],
+        )
+
+    async def is_punished(self, group_id, sender_id, now) -> bool:
+        return bool(await self.client.exists(self._punish_key(group_id, sender_id)))
+
+    async def claim(self, group_id, sender_id, now) -> bool:
+        key = self._punish_key(group_id, sender_id)
+        return bool(await self.client.set(key, "in_flight", nx=True, ex=int(self.in_flight_timeout)))
+
+    async def mark_punished(self, group_id, sender_id, now, duration):
+        await self.client.set(self._punish_key(group_id, sender_id), "punished", ex=max(int(duration), 1))
+
+    async def release(self, group_id, sender_id):
+        await self.client.delete(self._punish_key(group_id, sender_id))
+
+    async def close(self):
+        # aclose() replaced close() in redis 5.0.1
+        close = getattr(self.client, "aclose", None) or self.client.close
+        await close()
+
+
+def create_detection_state(
+    kind: str,
+    url: str,
+    detection_window: float,
+    history_window: float,
+    ban_duration: float,
+) -> DetectionState:
+    """Build the backend named by the DETECTION_BACKEND setting."""
+    kind = kind.lower()
+    if kind == "sqlite":
+        return SqliteDetectionState(Path(url) if url else STATE_DB_FILE, detection_window, history_window)
+    if kind == "redis":
+        return RedisDetectionState(url or "redis://localhost:6379/0", detection_window, history_window)
+    if kind != "memory":
+        logger.warning(f"Unknown detection backend '{kind}', falling back to memory")
+    return MemoryDetectionState(detection_window, history_window, ban_duration)
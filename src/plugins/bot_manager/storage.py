@@ -0,0 +1,149 @@
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Set
+
+from nonebot.log import logger
+
+from .persistence import WriteBehindFile
+
+# Scope id for bots monitored in every group
+GLOBAL_SCOPE = 0
+
+DATA_FILE = Path("bots.json")
+DB_FILE = Path("bots.db")
+
+
+class BotStorage(ABC):
+    """Persistent set of (scope, qq) rows; scope is a group id or GLOBAL_SCOPE.
+
+    ``add``/``remove`` receive single-row changes, so backends never need to
+    rewrite the whole list.
+    """
+
+    @abstractmethod
+    def load(self) -> Dict[int, Set[int]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, scope: int, qq: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, scope: int, qq: int):
+        raise NotImplementedError
+
+    async def flush(self):
+        pass
+
+
+class MemoryBotStorage(BotStorage):
+    """Keeps nothing across restarts; for tests and throwaway instances."""
+
+    def load(self) -> Dict[int, Set[int]]:
+        return {}
+
+    def add(self, scope: int, qq: int):
+        pass
+
+    def remove(self, scope: int, qq: int):
+        pass
+
+
+class JsonBotStorage(BotStorage):
+    """The original bots.json file; ``bots`` holds the global list.
+
+    Group-scoped lists live under ``groups`` keyed by group id, so files
+    written before scoping existed load unchanged.
+    """
+
+    def __init__(self, path: Path = DATA_FILE):
+        self.path = path
+        self.scopes: Dict[int, Set[int]] = {}
+        self._store = WriteBehindFile(path, self._snapshot)
+
+    def _snapshot(self) -> dict:
+        data: dict = {"bots": sorted(self.scopes.get(GLOBAL_SCOPE, ()))}
+        groups = {
+            str(scope): sorted(bots)
+            for scope, bots in self.scopes.items()
+            if scope != GLOBAL_SCOPE and bots
+        }
+        if groups:
+            data["groups"] = groups
+        return data
+
+    def load(self) -> Dict[int, Set[int]]:
+        self.scopes = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.scopes[GLOBAL_SCOPE] = {int(qq) for qq in data.get("bots", [])}
+                for scope, bots in data.get("groups", {}).items():
+                    self.scopes[int(scope)] = {int(qq) for qq in bots}
+            except Exception as e:
+                logger.error(f"Error loading bot list: {e}")
+                self.scopes = {}
+        else:
+            self._store.mark_dirty()
+        return {scope: set(bots) for scope, bots in self.scopes.items()}
+
+    def add(self, scope: int, qq: int):
+        self.scopes.setdefault(scope, set()).add(qq)
+        self._store.mark_dirty()
+
+    def remove(self, scope: int, qq: int):
+        self.scopes.get(scope, set()).discard(qq)
+        self._store.mark_dirty()
+
+    async def flush(self):
+        await self._store.flush()
+
+
+class SqliteBotStorage(BotStorage):
+    """One indexed row per (group_id, qq) in a WAL-mode SQLite database."""
+
+    def __init__(self, path: Path = DB_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(str(path), isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS monitored_bots ("
+            " group_id INTEGER NOT NULL,"
+            " qq INTEGER NOT NULL,"
+            " PRIMARY KEY (group_id, qq)"
+            ") WITHOUT ROWID"
+        )
+
+    def load(self) -> Dict[int, Set[int]]:
+        scopes: Dict[int, Set[int]] = {}
+        for group_id, qq in self.conn.execute("SELECT group_id, qq FROM monitored_bots"):
+            scopes.setdefault(group_id, set()).add(qq)
+        return scopes
+
+    def add(self, scope: int, qq: int):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO monitored_bots (group_id, qq) VALUES (?, ?)",
+            (scope, qq),
+        )
+
+    def remove(self, scope: int, qq: int):
+        self.conn.execute(
+            "DELETE FROM monitored_bots WHERE group_id = ? AND qq = ?",
+            (scope, qq),
+        )
+
+
+def create_storage(kind: str, path: str = "") -> BotStorage:
+    """Build the backend named by the BOT_STORAGE setting."""
+    kind = kind.lower()
+    if kind == "sqlite":
+        return SqliteBotStorage(Path(path) if path else DB_FILE)
+    if kind == "memory":
+        return MemoryBotStorage()
+    if kind != "json":
+        logger.warning(f"Unknown bot storage '{kind}', falling back to json")
+    return JsonBotStorage(Path(path) if path else DATA_FILE)
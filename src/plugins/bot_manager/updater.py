@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import List, NamedTuple, Sequence, Tuple
+
+# Update outcomes
+UPDATED = "updated"
+UP_TO_DATE = "up_to_date"
+FAILED = "failed"
+# The new code did not load; the checkout was rolled back
+INVALID = "invalid"
+# Updated, but local changes could not be re-applied on top
+CONFLICT = "conflict"
+
+# Set by supervisor.py for the bot process it runs
+SUPERVISED_ENV = "FOB_SUPERVISED"
+
+# Loads the plugin the way bot.py does, minus the network driver
+_VALIDATE_SCRIPT = """
+import sys
+import nonebot
+nonebot.init(driver="~none")
+plugin = sys.argv[1]
+loaded = nonebot.load_plugins(*sys.argv[2:])
+sys.exit(0 if plugin in {p.name for p in loaded} else 1)
+"""
+
+
+class UpdateResult(NamedTuple):
+    status: str
+    output: str
+    old_rev: str = ""
+    new_rev: str = ""
+
+
+def is_supervised() -> bool:
+    return os.environ.get(SUPERVISED_ENV) == "1"
+
+
+async def run(cwd: Path, *args: str, timeout: float = 120) -> Tuple[int, str]:
+    """Run a command without a shell; returns (exit code, stdout + stderr)."""
+    # Untranslated git messages, so output checks work in any locale
+    env = dict(os.environ, LC_ALL="C")
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        cwd=cwd,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return -1, f"{args[0]} timed out after {timeout}s"
+    code = proc.returncode if proc.returncode is not None else -1
+    return code, stdout.decode("utf-8", errors="replace").strip()
+
+
+async def validate(
+    repo: Path,
+    plugin: str = "bot_manager",
+    plugin_dirs: Sequence[str] = ("src/plugins",),
+    timeout: float = 120,
+) -> Tuple[bool, str]:
+    """Compile and import the checked-out plugin in a child interpreter."""
+    code, output = await run(repo, sys.executable, "-m", "compileall", "-q", *plugin_dirs, timeout=timeout)
+    if code != 0:
+        return False, output
+    code, output = await run(repo, sys.executable, "-c", _VALIDATE_SCRIPT, plugin, *plugin_dirs, timeout=timeout)
+    return code == 0, output
+
+
+async def update(
+    repo: Path,
+    plugin: str = "bot_manager",
+    plugin_dirs: Sequence[str] = ("src/plugins",),
+    timeout: float = 120,
+) -> UpdateResult:
+    """git pull ``repo``, keeping local changes, and check that the plugin still loads.
+
+    Local changes are stashed for the pull and re-applied afterwards. If
+    the pulled code fails ``validate``, the checkout is reset to the
+    previous commit before they are re-applied, so the running bot and the
+    files on disk stay in step.
+    """
+    code, output = await run(repo, "git", "--version", timeout=timeout)
+    if code != 0:
+        return UpdateResult(FAILED, "未找到 git 命令，无法自动更新。")
+
+    code, old_rev = await run(repo, "git", "rev-parse", "HEAD", timeout=timeout)
+    if code != 0:
+        return UpdateResult(FAILED, old_rev)
+
+    # Stash local changes to prevent overwrite errors
+    code, stash_output = await run(repo, "git", "stash", timeout=timeout)
+    was_stashed = code == 0 and "Saved working directory" in stash_output
+
+    notes: List[str] = []
+    code, pull_output = await run(repo, "git", "pull", timeout=timeout)
+    if code != 0:
+        status, notes = FAILED, [pull_output]
+        new_rev = old_rev
+    else:
+        _, new_rev = await run(repo, "git", "rev-parse", "HEAD", timeout=timeout)
+        if new_rev == old_rev:
+            status, notes = UP_TO_DATE, [pull_output]
+        else:
+            ok, check_output = await validate(repo, plugin, plugin_dirs, timeout)
+            if ok:
+                status, notes = UPDATED, [pull_output]
+            else:
+                await run(repo, "git", "reset", "--hard", old_rev, timeout=timeout)
+                status, notes = INVALID, [check_output]
+                new_rev = old_rev
+
+    # Restore local changes if they were stashed
+    if was_stashed:
+        code, pop_output = await run(repo, "git", "stash", "pop", timeout=timeout)
+        if code != 0:
+            notes.append(pop_output)
+            if status == UPDATED:
+                status = CONFLICT
+
+    return UpdateResult(status, "\n\n".join(note for note in notes if note), old_rev, new_rev)
@@ -0,0 +1,236 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# (timestamps, message ids) of one series, as exported for snapshots
+Columns = Tuple[array, array]
+
+
+class _Series:
+    """Timestamped message ids for one sender, stored as two packed columns.
+
+    ``timestamps`` (``array('d')``) and ``message_ids`` (``array('q')``) are
+    parallel buffers ordered by time. ``head`` marks the first entry inside the
+    history window and ``cursor`` the first entry inside the detection window;
+    both only move forward, and the dead prefix is cut off once it makes up
+    half the buffer, so each entry costs amortized O(1) and 16 bytes.
+    """
+
+    __slots__ = ("cursor", "head", "message_ids", "timestamps")
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.message_ids = array("q")
+        self.head = 0
+        self.cursor = 0
+
+    def append(self, timestamp: float, message_id: int):
+        self.timestamps.append(timestamp)
+        self.message_ids.append(message_id)
+
+    def advance(self, detection_start: float, history_start: float):
+        timestamps = self.timestamps
+        size = len(timestamps)
+        head = self.head
+        while head < size and timestamps[head] < history_start:
+            head += 1
+        cursor = max(self.cursor, head)
+        while cursor < size and timestamps[cursor] < detection_start:
+            cursor += 1
+
+        if head and head * 2 >= size:
+            del timestamps[:head]
+            del self.message_ids[:head]
+            cursor -= head
+            head = 0
+        self.head = head
+        self.cursor = cursor
+
+    def live(self) -> Columns:
+        """Copies of the entries still inside the history window."""
+        return self.timestamps[self.head:], self.message_ids[self.head:]
+
+    @classmethod
+    def from_columns(cls, columns: Columns, history_start: float) -> "_Series":
+        timestamps, message_ids = columns
+        start = bisect_left(timestamps, history_start)
+        series = cls()
+        series.timestamps = timestamps[start:] if start else timestamps
+        series.message_ids = message_ids[start:] if start else message_ids
+        return series
+
+    def recent_ids(self) -> List[int]:
+        # A message mentioning several bots is stored once per target
+        return list(dict.fromkeys(self.message_ids[self.cursor:]))
+
+    def __len__(self) -> int:
+        return len(self.timestamps) - self.cursor
+
+    def __bool__(self) -> bool:
+        return len(self.timestamps) > self.head
+
+
+# Shared stand-in for senders that never interacted with another bot; most
+# senders never do, so their windows skip the second pair of buffers.
+_NO_INTERACTIONS = _Series()
+
+
+class SenderWindow:
+    """Per-(group, sender) activity: every message, and bot-to-bot interactions."""
+
+    __slots__ = ("interactions", "messages")
+
+    def __init__(self):
+        self.messages = _Series()
+        self.interactions = _NO_INTERACTIONS
+
+    def advance(self, detection_start: float, history_start: float):
+        self.messages.advance(detection_start, history_start)
+        self.interactions.advance(detection_start, history_start)
+
+    def __bool__(self) -> bool:
+        return bool(self.messages or self.interactions)
+
+
+class SlidingWindow:
+    """Sliding-window message/interaction counters keyed by (group_id, sender_id).
+
+    Counts for the detection window are ``len()`` of the sender's series after
+    ``observe``; entries are kept for the (longer) history window.
+    """
+
+    def __init__(self, detection_window: float, history_window: float):
+        self.detection_window = detection_window
+        self.history_window = max(history_window, detection_window)
+        self.groups: Dict[int, Dict[int, SenderWindow]] = {}
+        # Reaper progress, so a pass can be split across several sweep() calls
+        self._sweep_queue: Deque[int] = deque()
+        self._sweep_pending: Dict[int, Deque[int]] = {}
+
+    def observe(
+        self,
+        group_id: int,
+        sender_id: int,
+        message_id: int,
+        targets: Iterable[int],
+        now: float,
+    ) -> SenderWindow:
+        """Record a message and return the sender's window, trimmed to ``now``."""
+        senders = self.groups.get(group_id)
+        if senders is None:
+            senders = self.groups[group_id] = {}
+        window = senders.get(sender_id)
+        if window is None:
+            window = senders[sender_id] = SenderWindow()
+
+        window.messages.append(now, message_id)
+        for _ in targets:
+            if window.interactions is _NO_INTERACTIONS:
+                window.interactions = _Series()
+            window.interactions.append(now, message_id)
+
+        window.advance(now - self.detection_window, now - self.history_window)
+        return window
+
+    def resize(self, detection_window: float, history_window: float):
+        """Use new window lengths from the next observe/peek on."""
+        grew = detection_window > self.detection_window
+        self.detection_window = detection_window
+        self.history_window = max(history_window, detection_window)
+        if not grew:
+            return
+        # Cursors only move forward, so rewind them to the start of the
+        # history; the next advance() moves each one to the new window start
+        for senders in self.groups.values():
+            for window in senders.values():
+                window.messages.cursor = window.messages.head
+                window.interactions.cursor = window.interactions.head
+
+    def peek(self, group_id: int, sender_id: int, now: float) -> Optional[SenderWindow]:
+        """The sender's window trimmed to ``now``, without recording anything."""
+        window = self.groups.get(group_id, {}).get(sender_id)
+        if window is not None:
+            window.advance(now - self.detection_window, now - self.history_window)
+        return window
+
+    def sweep(self, now: float, limit: int) -> bool:
+        """Expire history in at most ``limit`` sender windows, dropping empty keys.
+
+        Resumes where the previous call stopped; returns True once every group
+        present at the start of the pass has been visited.
+        """
+        if not self._sweep_queue:
+            self._sweep_queue.extend(self.groups)
+
+        detection_start = now - self.detection_window
+        history_start = now - self.history_window
+        budget = limit
+        while self._sweep_queue and budget > 0:
+            group_id = self._sweep_queue[0]
+            senders = self.groups.get(group_id)
+            if senders is None:
+                self._sweep_queue.popleft()
+                self._sweep_pending.pop(group_id, None)
+                continue
+
+            pending = self._sweep_pending.get(group_id)
+            if pending is None:
+                pending = self._sweep_pending[group_id] = deque(senders)
+            while pending and budget > 0:
+                sender_id = pending.popleft()
+                budget -= 1
+                window = senders.get(sender_id)
+                if window is None:
+                    continue
+                window.advance(detection_start, history_start)
+                if not window:
+                    del senders[sender_id]
+            if pending:
+                break
+
+            del self._sweep_pending[group_id]
+            self._sweep_queue.popleft()
+            if not senders:
+                del self.groups[group_id]
+
+        return not self._sweep_queue
+
+    def export(self) -> Iterator[Tuple[int, int, Columns, Columns]]:
+        """(group, sender, messages, interactions) for every sender with live entries."""
+        for group_id, senders in self.groups.items():
+            for sender_id, window in senders.items():
+                if window:
+                    yield group_id, sender_id, window.messages.live(), window.interactions.live()
+
+    def restore(self, group_id: int, sender_id: int, messages: Columns, interactions: Columns, now: float) -> bool:
+        """Put back a sender's exported entries, minus what expired since; False if none were left.
+
+        Senders that already have a window (seen since startup) are left alone.
+        """
+        senders = self.groups.setdefault(group_id, {})
+        if sender_id in senders:
+            return False
+        history_start = now - self.history_window
+        window = SenderWindow()
+        window.messages = _Series.from_columns(messages, history_start)
+        if len(interactions[0]):
+            window.interactions = _Series.from_columns(interactions, history_start)
+        window.advance(now - self.detection_window, history_start)
+        if not window:
+            if not senders:
+                del self.groups[group_id]
+            return False
+        senders[sender_id] = window
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Tracked groups, sender windows and retained entries (walks every key)."""
+        senders = 0
+        events = 0
+        for windows in self.groups.values():
+            senders += len(windows)
+            for window in windows.values():
+                events += len(window.messages.timestamps) - window.messages.head
+                events += len(window.interactions.timestamps) - window.interactions.head
+        return {"groups": len(self.groups), "senders": senders, "events": events}
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Keeps bot.py running: restarts it when it exits, e.g. after /update.
+
+    python supervisor.py [--min-uptime 10] [--max-backoff 60] [-- command ...]
+
+The default command is ``python bot.py``. The bot process gets
+FOB_SUPERVISED=1, so /update restarts it onto the new code instead of
+asking for a manual restart. SIGINT/SIGTERM are passed on to the bot and
+stop the supervisor once it has exited. The bot runs in its own session, so
+a terminal Ctrl+C reaches it once, through the supervisor, and it can shut
+down cleanly instead of being forced out by a second SIGINT.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from typing import List, Optional
+
+SUPERVISED_ENV = "FOB_SUPERVISED"
+
+
+async def supervise(command: List[str], min_uptime: float, max_backoff: float) -> int:
+    env = dict(os.environ, **{SUPERVISED_ENV: "1"})
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    proc: Optional[asyncio.subprocess.Process] = None
+
+    def stop(signum: int):
+        stopping.set()
+        if proc is not None and proc.returncode is None:
+            proc.send_signal(signum)
+
+    forwarding = False
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop, signum)
+            forwarding = True
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C reaches the child directly
+            pass
+
+    backoff = 0.0
+    while True:
+        started = time.monotonic()
+        # Out of the terminal's process group when we forward signals ourselves
+        proc = await asyncio.create_subprocess_exec(*command, env=env, start_new_session=forwarding)
+        code = await proc.wait()
+        if stopping.is_set():
+            return code
+
+        # Quick restarts for clean exits and long runs; back off on crash loops
+        uptime = time.monotonic() - started
+        if code == 0 or uptime >= min_uptime:
+            backoff = 0.0
+        else:
+            backoff = min(max(backoff * 2, 1.0), max_backoff)
+        print(f"[supervisor] bot exited with code {code} after {uptime:.1f}s, restarting in {backoff:.0f}s", flush=True)
+        try:
+            await asyncio.wait_for(stopping.wait(), backoff or 0.01)
+            return code
+        except asyncio.TimeoutError:
+            pass
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Run bot.py and restart it when it exits.")
+    parser.add_argument("--min-uptime", type=float, default=10, help="runs shorter than this (seconds) count as crashes")
+    parser.add_argument("--max-backoff", type=float, default=60, help="longest wait (seconds) between crash restarts")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="command to run (default: python bot.py)")
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    command = command or [sys.executable, "bot.py"]
+    try:
+        return asyncio.run(supervise(command, args.min_uptime, args.max_backoff))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# Plugin submodules are loaded with benchmarks/_plugin.py, which skips the
+# NoneBot plugin __init__ (it needs a running driver)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from nonebot.adapters.onebot.v11.exception import ActionFailed
+
+from _plugin import load_plugin_module
+
+accounts = load_plugin_module("accounts")
+
+GROUP = 1
+
+
+class FailingBot:
+    """Answers every call with ActionFailed and remembers what it was asked."""
+
+    def __init__(self, self_id: int):
+        self.self_id = str(self_id)
+        self.calls = []
+
+    async def call_api(self, api, **data):
+        self.calls.append(api)
+        raise ActionFailed(retcode=100, msg="消息不存在")
+
+
+def make_route():
+    origin, other = FailingBot(10), FailingBot(11)
+    bots = {origin.self_id: origin, other.self_id: other}
+    registry = accounts.AccountRegistry(lambda: bots)
+    registry.admins = {origin.self_id: {GROUP}, other.self_id: {GROUP}}
+    registry.members = {origin.self_id: {GROUP}, other.self_id: {GROUP}}
+    return registry.route(GROUP, origin), origin, other
+
+
+def test_recalls_stay_on_the_receiving_account():
+    route, origin, other = make_route()
+    with pytest.raises(ActionFailed):
+        asyncio.run(route.delete_msg(message_id=5))
+    with pytest.raises(ActionFailed):
+        asyncio.run(route.call_api("delete_msgs", message_ids=[5, 6]))
+    assert origin.calls == ["delete_msg", "delete_msgs"]
+    assert other.calls == []
+    assert route.self_id == origin.self_id
+
+
+def test_bans_and_messages_fail_over():
+    route, origin, other = make_route()
+    with pytest.raises(ActionFailed):
+        asyncio.run(route.set_group_ban(group_id=GROUP, user_id=20, duration=60))
+    with pytest.raises(ActionFailed):
+        asyncio.run(route.send_group_msg(group_id=GROUP, message="hi"))
+    assert origin.calls == ["set_group_ban", "send_group_msg"]
+    assert other.calls == ["set_group_ban", "send_group_msg"]
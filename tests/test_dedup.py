@@ -0,0 +1,35 @@
+from _plugin import load_plugin_module
+
+dedup = load_plugin_module("dedup")
+
+
+def test_repeats_are_caught_until_two_rotations_pass():
+    index = dedup.DedupIndex(ttl=60, max_entries=1000)
+    assert index.first_seen(1, 100, 1000)
+    assert not index.first_seen(1, 100, 1010)
+    # Same message id in another group is a different message
+    assert index.first_seen(2, 100, 1010)
+
+    # One rotation (ttl / 2) later the key sits in the previous generation
+    assert not index.first_seen(1, 100, 1031)
+    # A second rotation drops it: remembered for between ttl / 2 and ttl
+    assert index.first_seen(1, 100, 1061)
+
+
+def test_long_silence_forgets_everything():
+    index = dedup.DedupIndex(ttl=60, max_entries=1000)
+    index.first_seen(1, 100, 1000)
+    index.first_seen(1, 101, 1029)
+    # The first rotation after more than ttl must not keep the stale generation
+    assert index.first_seen(1, 101, 1100)
+    assert len(index) == 1
+
+
+def test_entries_are_bounded():
+    index = dedup.DedupIndex(ttl=600, max_entries=10)
+    for message_id in range(1000):
+        assert index.first_seen(1, message_id, 1000)
+        assert len(index) <= 10
+    # The most recent keys are still remembered
+    assert not index.first_seen(1, 999, 1000)
+    assert not index.first_seen(1, 995, 1000)
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Any, List, Tuple
+
+from _plugin import load_plugin_module
+
+detector_module = load_plugin_module("detector")
+graph_module = load_plugin_module("graph")
+moderation = load_plugin_module("moderation")
+state_module = load_plugin_module("state")
+
+BOTS = [101, 102, 103]
+
+
+class MockBot:
+    self_id = "1"
+
+    async def set_group_ban(self, **data: Any):
+        pass
+
+    async def delete_msg(self, **data: Any):
+        pass
+
+    async def send_group_msg(self, **data: Any):
+        pass
+
+
+def replay(messages: List[Tuple[int, int, float]]) -> List[Any]:
+    """Feed (sender, target, time) mentions through a Detector; returns the decisions."""
+
+    async def run():
+        # Plugin defaults: 30 s window, interaction threshold 2, and the
+        # graph's half-life of four windows with min weight 0.5
+        settings = detector_module.DetectionSettings()
+        state = state_module.MemoryDetectionState(
+            settings.detection_window, settings.history_window, settings.ban_duration
+        )
+        graph = graph_module.InteractionGraph(settings.detection_window * 4, 0.5, 5)
+        recall_queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=0, retry_delay=0)
+        detector = detector_module.Detector(state, graph, recall_queue, settings)
+        decisions: List[Any] = []
+        detector.listeners.append(decisions.append)
+
+        for message_id, (sender, target, now) in enumerate(messages, 1):
+            await detector.process(MockBot(), 1, sender, message_id, [target], now)
+        await detector.notices.flush()
+        return decisions
+
+    return asyncio.run(run())
+
+
+def replay_ring(step: float, rounds: int = 4) -> List[Any]:
+    """Each bot in turn @s the next one, ``step`` seconds apart."""
+    return replay([
+        (BOTS[turn % len(BOTS)], BOTS[(turn + 1) % len(BOTS)], 1000 + turn * step)
+        for turn in range(rounds * len(BOTS))
+    ])
+
+
+def test_fast_ring_is_caught_as_a_cycle_before_the_interaction_rule():
+    decisions = replay_ring(step=1)
+    assert decisions
+    assert {d.kind for d in decisions} == {"cycle"}
+    assert sorted(d.offender for d in decisions) == BOTS
+
+
+def test_slow_ring_is_caught():
+    # Each bot speaks every 36 s, more than the 30 s detection window, so no
+    # single sender ever reaches the interaction threshold
+    decisions = replay_ring(step=12)
+    assert [d.kind for d in decisions] == ["cycle"] * 3
+    assert sorted(d.offender for d in decisions) == BOTS
+    # Caught on the first round: the third message closes the ring
+    assert decisions[0].timestamp == 1000 + 2 * 12
+
+
+def test_single_exchange_between_two_bots_bans_nobody():
+    # One mention and one answer 90 s later: an ordinary reply, not a loop
+    assert replay([(101, 102, 1000), (102, 101, 1090)]) == []
+
+
+def test_fast_back_and_forth_is_left_to_the_interaction_threshold():
+    decisions = replay([(101, 102, 1000), (102, 101, 1001), (101, 102, 1002), (102, 101, 1003)])
+    assert [d.kind for d in decisions] == ["interaction", "interaction"]
+    assert sorted(d.offender for d in decisions) == [101, 102]
@@ -0,0 +1,45 @@
+from nonebot.adapters.onebot.v11 import GroupMessageEvent, Message, MessageSegment
+
+from _plugin import load_plugin_module
+
+message_view_module = load_plugin_module("message_view")
+
+
+def make_event(message: Message) -> GroupMessageEvent:
+    return GroupMessageEvent.model_validate({
+        "time": 1,
+        "self_id": 1,
+        "post_type": "message",
+        "sub_type": "normal",
+        "user_id": 2,
+        "message_type": "group",
+        "message_id": 3,
+        "message": message,
+        "original_message": message,
+        "raw_message": str(message),
+        "font": 0,
+        "sender": {"user_id": 2},
+        "group_id": 5,
+        "to_me": False,
+    })
+
+
+def test_view_is_parsed_once_per_event():
+    message = MessageSegment.at(10) + "hi " + MessageSegment.at(10) + MessageSegment.at("all") + MessageSegment.at(11)
+    event = make_event(message)
+    view = message_view_module.message_view(event)
+    assert view.mentions == (10, 11)
+    assert view.mentions_all
+    assert view.plain_text == "hi "
+    assert message_view_module.message_view(event) is view
+    # Kept on the event, not in its payload
+    assert "_bot_manager_view" not in event.model_dump()
+
+
+def test_views_are_not_shared_between_events():
+    first = make_event(Message("one"))
+    first_view = message_view_module.message_view(first)
+    del first
+    second = make_event(Message("two"))
+    assert message_view_module.message_view(second).plain_text == "two"
+    assert first_view.plain_text == "one"
@@ -0,0 +1,76 @@
+import asyncio
+
+from _plugin import load_plugin_module
+
+accounts = load_plugin_module("accounts")
+permissions = load_plugin_module("permissions")
+
+GROUP = 1
+ADMIN_ACCOUNT, OWNER_ACCOUNT, TARGET = 10, 11, 20
+ROLES = {ADMIN_ACCOUNT: "admin", OWNER_ACCOUNT: "owner", TARGET: "admin"}
+
+
+class FakeBot:
+    def __init__(self, self_id: int):
+        self.self_id = str(self_id)
+        self.calls = []
+
+    async def call_api(self, api, **data):
+        self.calls.append((api, data))
+        if api == "get_group_member_info":
+            return {"role": ROLES.get(data["user_id"], "member")}
+        if api == "get_group_member_list":
+            return [{"user_id": user_id, "role": role} for user_id, role in ROLES.items()]
+        return None
+
+
+def make_route(cache):
+    origin, owner = FakeBot(ADMIN_ACCOUNT), FakeBot(OWNER_ACCOUNT)
+    bots = {origin.self_id: origin, owner.self_id: owner}
+    registry = accounts.AccountRegistry(lambda: bots, permissions=cache)
+    registry.admins = {origin.self_id: {GROUP}, owner.self_id: {GROUP}}
+    registry.members = {origin.self_id: {GROUP}, owner.self_id: {GROUP}}
+    return registry.route(GROUP, origin), origin, owner
+
+
+def test_owner_account_can_ban_admin_seen_by_admin_account():
+    async def run():
+        cache = permissions.PermissionCache(600)
+        route, origin, owner = make_route(cache)
+        # The event came in on an admin account, which can't mute another admin
+        assert await cache.blocker(route, GROUP, TARGET, [ADMIN_ACCOUNT], 1000) == permissions.TARGET_ADMIN
+        # ... but the owner account in the same group can, so the ban goes ahead
+        assert await cache.blocker(route, GROUP, TARGET, route.ban_accounts(), 1000) == ""
+
+        await route.set_group_ban(group_id=GROUP, user_id=TARGET, duration=60)
+        assert [api for api, _ in owner.calls].count("set_group_ban") == 1
+        assert all(api != "set_group_ban" for api, _ in origin.calls)
+
+    asyncio.run(run())
+
+
+def test_blocker_reports_plain_member_accounts():
+    async def run():
+        cache = permissions.PermissionCache(600)
+        bot = FakeBot(30)
+        assert await cache.blocker(bot, GROUP, 40, [30], 1000) == permissions.NOT_ADMIN
+        # Cached: no second round trip
+        assert await cache.blocker(bot, GROUP, 40, [30], 1001) == permissions.NOT_ADMIN
+        assert len(bot.calls) == 2
+
+    asyncio.run(run())
+
+
+def test_warm_loads_each_group_once_per_ttl():
+    async def run():
+        cache = permissions.PermissionCache(600)
+        bot = FakeBot(ADMIN_ACCOUNT)
+        await cache.warm(bot, [GROUP], 1000, pause=0)
+        await cache.warm(bot, [GROUP], 1100, pause=0)
+        assert [api for api, _ in bot.calls] == ["get_group_member_list"]
+        assert cache.get(GROUP, OWNER_ACCOUNT, 1100) == "owner"
+        assert cache.get(GROUP, 99, 1100) == "member"
+        await cache.warm(bot, [GROUP], 1600, pause=0)
+        assert len(bot.calls) == 2
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from _plugin import load_plugin_module
+
+persistence = load_plugin_module("persistence")
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="POSIX permission bits")
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_rewrites_keep_the_file_mode(tmp_path):
+    path = tmp_path / "bots.json"
+    path.write_text("{}")
+    path.chmod(0o644)
+    persistence.atomic_write_json(path, {"groups": {}})
+    assert mode(path) == 0o644
+    path.chmod(0o640)
+    persistence.atomic_write_bytes(path, b"{}")
+    assert mode(path) == 0o640
+    assert path.read_bytes() == b"{}"
+
+
+def test_new_files_follow_the_umask(tmp_path):
+    path = tmp_path / "detection.snap"
+    persistence.atomic_write_bytes(path, b"data")
+    assert mode(path) == 0o666 & ~persistence._UMASK
+    # No temp files left behind
+    assert [p.name for p in tmp_path.iterdir()] == ["detection.snap"]
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from nonebot.adapters.onebot.v11.exception import ActionFailed
+
+from _plugin import load_plugin_module
+
+moderation = load_plugin_module("moderation")
+
+
+class RecallBot:
+    """delete_msg fails with the queued errors for a message, then succeeds."""
+
+    self_id = "1"
+
+    def __init__(self, errors: Dict[int, List[Exception]], batch_error: Any = None):
+        self.errors = errors
+        self.batch_error = batch_error
+        self.attempts: List[tuple] = []
+
+    async def delete_msg(self, message_id: int):
+        self.attempts.append((message_id, time.monotonic()))
+        queued = self.errors.get(message_id)
+        if queued:
+            raise queued.pop(0)
+
+    async def call_api(self, api: str, **data: Any):
+        self.attempts.append((api, time.monotonic()))
+        if self.batch_error is not None:
+            raise self.batch_error
+        return {"failed": [{"message_id": 7, "error": "消息不存在"}]}
+
+
+def failed(msg: str, retcode: int = 100) -> ActionFailed:
+    return ActionFailed(retcode=retcode, msg=msg)
+
+
+def drain(queue, bot, message_ids: List[int], count: int) -> List[Any]:
+    """Queue a batch and collect final results until ``count`` have come in."""
+
+    async def run():
+        results: List[Any] = []
+        done = asyncio.Event()
+
+        def listener(result):
+            results.append(result)
+            if len(results) >= count:
+                done.set()
+
+        queue.listeners.append(listener)
+        queue.start()
+        queue.enqueue(bot, message_ids)
+        await asyncio.wait_for(done.wait(), 5)
+        await queue.stop()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_errors_are_classified():
+    assert moderation.classify_recall_error(failed("消息不存在")) == moderation.RECALL_GONE
+    assert moderation.classify_recall_error(failed("message recalled")) == moderation.RECALL_GONE
+    assert moderation.classify_recall_error(failed("超过撤回时间")) == moderation.RECALL_TOO_OLD
+    assert moderation.classify_recall_error(failed("Timeout")) == moderation.RECALL_RETRY
+    assert moderation.classify_recall_error(RuntimeError("connection reset")) == moderation.RECALL_RETRY
+    assert moderation._is_unsupported(failed("", retcode=1404))
+    assert moderation._is_unsupported(failed("unknown action"))
+    # A generic failure is not a missing API
+    assert not moderation._is_unsupported(failed("未知错误"))
+
+
+def test_transient_failures_are_retried_with_backoff():
+    queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=3, retry_delay=0.02)
+    bot = RecallBot({1: [failed("timeout"), failed("timeout")], 2: [failed("消息不存在")]})
+    results = drain(queue, bot, [1, 2], 2)
+
+    assert {r.message_id: r.status for r in results} == {1: moderation.RECALL_OK, 2: moderation.RECALL_GONE}
+    # Gone is final: tried once. The transient one: 0.02 s, then 0.04 s later
+    assert [mid for mid, _ in bot.attempts].count(2) == 1
+    times = [at for mid, at in bot.attempts if mid == 1]
+    assert len(times) == 3
+    assert times[1] - times[0] >= 0.02
+    assert times[2] - times[1] >= 0.04
+
+
+def test_retries_give_up_as_failed():
+    queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=1, retry_delay=0.01)
+    bot = RecallBot({1: [failed("timeout")] * 5})
+    results = drain(queue, bot, [1], 1)
+    assert [r.status for r in results] == [moderation.RECALL_FAILED]
+    assert len(bot.attempts) == 2
+    assert queue.pending() == 0
+
+
+def test_ids_already_queued_are_not_queued_again():
+    async def run():
+        queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=0, retry_delay=0)
+        bot = RecallBot({})
+        assert queue.enqueue(bot, [1, 2]) == 2
+        assert queue.enqueue(bot, [2, 3]) == 1
+        assert queue.pending() == 3
+        queue.start()
+        await queue.join()
+        await queue.stop()
+        assert sorted(mid for mid, _ in bot.attempts) == [1, 2, 3]
+        # Once done, the same id can be queued again
+        assert queue.enqueue(bot, [1]) == 1
+
+    asyncio.run(run())
+
+
+def test_batch_api_reports_per_message_results():
+    queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=0, retry_delay=0, batch_api="delete_msgs")
+    bot = RecallBot({})
+    results = drain(queue, bot, [6, 7], 2)
+    assert {r.message_id: r.status for r in results} == {6: moderation.RECALL_OK, 7: moderation.RECALL_GONE}
+    assert [api for api, _ in bot.attempts] == ["delete_msgs"]
+
+
+def test_missing_batch_api_falls_back_to_single_recalls():
+    queue = moderation.RecallQueue(rate=0, burst=1, workers=1, max_retries=0, retry_delay=0, batch_api="delete_msgs")
+    bot = RecallBot({}, batch_error=failed("", retcode=1404))
+    results = drain(queue, bot, [6, 7], 2)
+    assert all(r.status == moderation.RECALL_OK for r in results)
+    assert [api for api, _ in bot.attempts] == ["delete_msgs", 6, 7]
+    assert bot.self_id in queue._batch_unsupported
@@ -0,0 +1,108 @@
+import asyncio
+from typing import List
+
+from _plugin import load_plugin_module
+
+sharding = load_plugin_module("sharding")
+
+
+def run_full_queue(policy: str) -> List[str]:
+    """Fill a one-shard, two-slot dispatcher behind a stalled job, then submit one more."""
+
+    async def run():
+        dispatcher = sharding.ShardedDispatcher(1, 2, policy, block_timeout=0.05)
+        dispatcher.start()
+        ran: List[str] = []
+        release = asyncio.Event()
+
+        async def stalled():
+            await release.wait()
+            ran.append("stalled")
+
+        def job(name: str):
+            async def run_job():
+                ran.append(name)
+            return run_job
+
+        await dispatcher.submit(1, stalled)
+        await asyncio.sleep(0)  # the worker picks it up
+        assert await dispatcher.submit(1, job("a"))
+        assert await dispatcher.submit(1, job("b"))
+        accepted = await dispatcher.submit(1, job("c"))
+        assert accepted == (policy == sharding.DROP_OLDEST)
+        release.set()
+        await dispatcher.stop()
+        return ran
+
+    return asyncio.run(run())
+
+
+def test_drop_oldest_makes_room_for_the_new_job():
+    assert run_full_queue(sharding.DROP_OLDEST) == ["stalled", "b", "c"]
+
+
+def test_drop_newest_keeps_the_queue():
+    assert run_full_queue(sharding.DROP_NEWEST) == ["stalled", "a", "b"]
+
+
+def test_block_gives_up_after_the_timeout():
+    assert run_full_queue(sharding.BLOCK) == ["stalled", "a", "b"]
+
+
+def test_block_waits_for_room():
+    async def run():
+        dispatcher = sharding.ShardedDispatcher(1, 1, sharding.BLOCK, block_timeout=1)
+        dispatcher.start()
+        ran: List[int] = []
+
+        def job(n: int):
+            async def run_job():
+                await asyncio.sleep(0.01)
+                ran.append(n)
+            return run_job
+
+        for n in range(4):
+            assert await dispatcher.submit(1, job(n))
+        await dispatcher.stop()
+        return ran
+
+    assert asyncio.run(run()) == [0, 1, 2, 3]
+
+
+def test_jobs_run_in_order_per_group():
+    async def run():
+        dispatcher = sharding.ShardedDispatcher(3, 100)
+        dispatcher.start()
+        ran: List[tuple] = []
+
+        def job(group_id: int, n: int):
+            async def run_job():
+                # Uneven delays, so only per-shard ordering keeps them in sequence
+                await asyncio.sleep(0.001 * ((group_id + n) % 3))
+                ran.append((group_id, n))
+            return run_job
+
+        for n in range(10):
+            for group_id in (1, 2, 4):
+                await dispatcher.submit(group_id, job(group_id, n))
+        # Groups 1 and 4 share a shard
+        assert dispatcher.pending(1) + dispatcher.pending(4) > 0
+        await dispatcher.stop()
+        assert dispatcher.pending() == 0
+        return ran
+
+    ran = asyncio.run(run())
+    assert len(ran) == 30
+    for group_id in (1, 2, 4):
+        assert [n for g, n in ran if g == group_id] == list(range(10))
+
+
+def test_jobs_run_inline_before_start():
+    ran: List[int] = []
+
+    async def job():
+        ran.append(1)
+
+    dispatcher = sharding.ShardedDispatcher(2, 1)
+    assert asyncio.run(dispatcher.submit(5, job))
+    assert ran == [1]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from _plugin import load_plugin_module
+
+punishment = load_plugin_module("punishment")
+snapshot = load_plugin_module("snapshot")
+window_module = load_plugin_module("window")
+
+
+def make_state():
+    return window_module.SlidingWindow(30, 240), punishment.PunishmentTable(600)
+
+
+def filled_state(now: float):
+    window, punishments = make_state()
+    # Sender 10 talks to bot 20 now and then; sender 11 went quiet long ago
+    for message_id, at in enumerate((now - 200, now - 20, now - 10, now)):
+        window.observe(1, 10, message_id, [20], at)
+    window.observe(1, 11, 99, [], now - 100)
+    window.observe(2, 12, 100, [], now - 1)
+    punishments.succeed(1, 30, now, 600)
+    punishments.succeed(1, 31, now, 60)
+    # Claims in flight are not carried over
+    punishments.begin(1, 32, now)
+    return window, punishments
+
+
+def test_round_trip_restores_windows_and_bans(tmp_path):
+    now = 10_000.0
+    window, punishments = filled_state(now)
+    file = snapshot.SnapshotFile(tmp_path / "detection.snap", window, punishments)
+    asyncio.run(file.save(now))
+
+    restored, restored_punishments = make_state()
+    later = now + 5
+    stats = asyncio.run(snapshot.SnapshotFile(file.path, restored, restored_punishments).load(later, budget=5))
+    assert stats == {"senders": 3, "expired": 0, "skipped": 0, "punishments": 2}
+
+    for group_id, sender_id in ((1, 10), (1, 11), (2, 12)):
+        before = window.peek(group_id, sender_id, later)
+        after = restored.peek(group_id, sender_id, later)
+        assert before is not None and after is not None
+        assert after.messages.recent_ids() == before.messages.recent_ids()
+        assert after.interactions.recent_ids() == before.interactions.recent_ids()
+        assert len(after.messages) == len(before.messages)
+    assert restored_punishments.is_active(1, 30, later)
+    assert not restored_punishments.is_active(1, 32, later)
+
+
+def test_expired_entries_are_skipped(tmp_path):
+    now = 10_000.0
+    window, punishments = filled_state(now)
+    path = tmp_path / "detection.snap"
+    snapshot.write(path, snapshot.capture(window, punishments, now))
+
+    saved_at, body = snapshot.read(path)
+    assert saved_at == now
+    restored, restored_punishments = make_state()
+    # 150 s on: sender 11's only message left the 240 s history, and the 60 s ban ran out
+    stats = snapshot.restore(body, restored, restored_punishments, now + 150, budget=5)
+    assert stats == {"senders": 2, "expired": 1, "skipped": 0, "punishments": 1}
+    assert restored.peek(1, 11, now + 150) is None
+    assert not restored_punishments.is_active(1, 31, now + 150)
+
+    # Older than the history window: nothing is restored at all
+    file = snapshot.SnapshotFile(path, *make_state())
+    assert asyncio.run(file.load(now + 241, budget=5)) == {"senders": 0}
+
+
+def test_restore_stops_at_the_budget(tmp_path):
+    now = 10_000.0
+    window, punishments = filled_state(now)
+    path = tmp_path / "detection.snap"
+    snapshot.write(path, snapshot.capture(window, punishments, now))
+    _, body = snapshot.read(path)
+
+    restored, restored_punishments = make_state()
+    stats = snapshot.restore(body, restored, restored_punishments, now, budget=-1)
+    # Bans are cheap and always restored; windows wait for the budget
+    assert stats == {"senders": 0, "expired": 0, "skipped": 3, "punishments": 2}
+    assert restored.groups == {}
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "detection.snap"
+    path.write_bytes(b"not a snapshot at all")
+    with pytest.raises(ValueError):
+        snapshot.read(path)
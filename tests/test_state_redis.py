@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("lupa")
+fakeredis = pytest.importorskip("fakeredis")
+
+from _plugin import load_plugin_module
+
+state = load_plugin_module("state")
+
+
+def make_state():
+    return state.RedisDetectionState(
+        "", detection_window=30, history_window=240, client=fakeredis.aioredis.FakeRedis()
+    )
+
+
+def test_observe_counts_inside_detection_window():
+    async def run():
+        redis_state = make_state()
+        await redis_state.observe(1, 10, 100, [], now=1000)
+        await redis_state.observe(1, 10, 101, [20], now=1010)
+        window = await redis_state.observe(1, 10, 102, [20, 30], now=1035)
+        # 100 is older than the 30 s detection window
+        assert window.messages.recent_ids() == [101, 102]
+        # One interaction per target, but each message is recalled once
+        assert window.interactions.recent_ids() == [101, 102]
+        assert len(window.interactions) == 3
+
+        peeked = await redis_state.peek(1, 10, now=1035)
+        assert peeked.messages.recent_ids() == [101, 102]
+        # Other senders and groups are separate
+        assert len((await redis_state.peek(2, 10, now=1035)).messages) == 0
+        await redis_state.close()
+
+    asyncio.run(run())
+
+
+def test_claim_release_and_mark_punished():
+    async def run():
+        redis_state = make_state()
+        assert not await redis_state.is_punished(1, 10, now=0)
+
+        assert await redis_state.claim(1, 10, now=0)
+        # A second handler (or process) can't claim the same offender
+        assert not await redis_state.claim(1, 10, now=0)
+        assert await redis_state.is_punished(1, 10, now=0)
+
+        await redis_state.release(1, 10)
+        assert not await redis_state.is_punished(1, 10, now=0)
+
+        assert await redis_state.claim(1, 10, now=0)
+        await redis_state.mark_punished(1, 10, now=0, duration=600)
+        assert await redis_state.is_punished(1, 10, now=0)
+        assert not await redis_state.claim(1, 10, now=0)
+        assert await redis_state.client.ttl(redis_state._punish_key(1, 10)) > 30
+        await redis_state.close()
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import asyncio
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("nonebot")
+if shutil.which("git") is None:
+    pytest.skip("git is not installed", allow_module_level=True)
+
+from _plugin import load_plugin_module
+
+updater = load_plugin_module("updater")
+
+PLUGIN = Path("src/plugins/bot_manager/__init__.py")
+
+
+def git(cwd: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def commit(repo: Path, files: dict, message: str):
+    for name, text in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    git(repo, "add", *files)
+    git(repo, "commit", "-q", "-m", message)
+    git(repo, "push", "-q", "origin", "HEAD")
+
+
+@pytest.fixture
+def repos(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """A bare origin, a deployed clone running the bot, and a dev clone to push from."""
+    for var in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(var, "test")
+    for var in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(var, "test@example.com")
+    origin = tmp_path / "origin.git"
+    git(tmp_path, "init", "-q", "--bare", str(origin))
+    dev = tmp_path / "dev"
+    git(tmp_path, "clone", "-q", str(origin), str(dev))
+    commit(dev, {str(PLUGIN): "VERSION = 1\n", ".env": "SPAM_THRESHOLD=5\n"}, "v1")
+    deployed = tmp_path / "deployed"
+    git(tmp_path, "clone", "-q", str(origin), str(deployed))
+    return dev, deployed
+
+
+def test_update_validates_rolls_back_and_keeps_local_changes(repos):
+    dev, deployed = repos
+    # A local edit the bot's owner made on the server
+    (deployed / ".env").write_text("SPAM_THRESHOLD=9\n", encoding="utf-8")
+    v1 = git(deployed, "rev-parse", "HEAD")
+
+    result = asyncio.run(updater.update(deployed))
+    assert result.status == updater.UP_TO_DATE
+
+    # A good commit is pulled and kept
+    commit(dev, {str(PLUGIN): "VERSION = 2\n"}, "v2")
+    result = asyncio.run(updater.update(deployed))
+    assert result.status == updater.UPDATED, result.output
+    v2 = git(deployed, "rev-parse", "HEAD")
+    assert (result.old_rev, result.new_rev) == (v1, v2)
+    assert (deployed / PLUGIN).read_text(encoding="utf-8") == "VERSION = 2\n"
+    assert (deployed / ".env").read_text(encoding="utf-8") == "SPAM_THRESHOLD=9\n"
+
+    # A commit that doesn't import is rolled back
+    commit(dev, {str(PLUGIN): "raise RuntimeError('broken')\n"}, "broken")
+    result = asyncio.run(updater.update(deployed))
+    assert result.status == updater.INVALID
+    assert "broken" in result.output
+    assert git(deployed, "rev-parse", "HEAD") == v2
+    assert (deployed / PLUGIN).read_text(encoding="utf-8") == "VERSION = 2\n"
+    assert (deployed / ".env").read_text(encoding="utf-8") == "SPAM_THRESHOLD=9\n"
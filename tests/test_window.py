@@ -0,0 +1,95 @@
+import asyncio
+
+from _plugin import load_plugin_module
+
+baseline_module = load_plugin_module("baseline")
+state_module = load_plugin_module("state")
+window_module = load_plugin_module("window")
+
+
+def test_growing_the_detection_window_counts_older_messages():
+    async def run():
+        state = state_module.MemoryDetectionState(10, 240, 600)
+        # One message every 8 s; a 10 s window holds the last two
+        for message_id in range(6):
+            await state.observe(1, 2, message_id, [], 1000.0 + message_id * 8)
+        now = 1048.0
+        window = await state.observe(1, 2, 6, [], now)
+        assert len(window.messages) == 2
+
+        state.resize(60, 240)
+        window = await state.peek(1, 2, now)
+        assert len(window.messages) == 7
+        assert window.messages.recent_ids() == list(range(7))
+
+        state.resize(10, 240)
+        window = await state.peek(1, 2, now)
+        assert len(window.messages) == 2
+
+    asyncio.run(run())
+
+
+def test_baselines_follow_the_detection_window():
+    baselines = baseline_module.BaselineTracker(30, alpha=0.5, sigmas=0, warmup=3, floor=1, ceiling=100, path=None)
+    # Four messages in every 30 s bucket
+    for bucket in range(6):
+        for i in range(4):
+            baselines.observe(1, 2, bucket * 30 + i, default=50)
+    assert baselines.learned(1, 2) == 4
+
+    # Twice the window: learned thresholds are compared to twice the counts
+    baselines.resize(60)
+    assert baselines.learned(1, 2) == 8
+    # Counting starts afresh in 60 s buckets
+    for i in range(8):
+        baselines.observe(1, 2, 600 + i, default=50)
+    baselines.observe(1, 2, 660, default=50)
+    assert baselines.learned(1, 2) == 8
+
+
+def test_windows_count_per_sender_and_trim_to_the_detection_window():
+    window = window_module.SlidingWindow(30, 240)
+    window.observe(1, 10, 0, [], 1000)
+    window.observe(1, 10, 1, [20, 21], 1010)
+    sender = window.observe(1, 10, 2, [], 1020)
+    # Group 2 and sender 11 are counted separately
+    window.observe(2, 10, 50, [], 1020)
+    window.observe(1, 11, 51, [], 1020)
+    assert len(sender.messages) == 3
+    # A message mentioning two bots is two interactions but one id to recall
+    assert len(sender.interactions) == 2
+    assert sender.interactions.recent_ids() == [1]
+
+    sender = window.observe(1, 10, 3, [], 1045)
+    assert sender.messages.recent_ids() == [2, 3]
+    assert len(sender.interactions) == 0
+    # Out of the detection window but still held for the history window
+    assert window.stats() == {"groups": 2, "senders": 3, "events": 8}
+
+
+def test_senders_without_interactions_share_no_buffers():
+    window = window_module.SlidingWindow(30, 240)
+    quiet = window.observe(1, 10, 1, [], 1000)
+    chatty = window.observe(1, 11, 2, [20], 1000)
+    assert quiet.interactions is not chatty.interactions
+    assert quiet.interactions is window.observe(1, 12, 3, [], 1000).interactions
+
+
+def test_sweep_expires_idle_senders_in_slices():
+    window = window_module.SlidingWindow(30, 240)
+    for group_id in range(3):
+        for sender_id in range(4):
+            window.observe(group_id, sender_id, sender_id, [], 1000)
+    window.observe(0, 0, 99, [], 1200)
+
+    # 12 windows, at most 5 per call: the pass takes three calls
+    now = 1300
+    assert not window.sweep(now, 5)
+    assert not window.sweep(now, 5)
+    assert window.sweep(now, 5)
+    # Only the sender who spoke within the history window is left
+    assert window.groups.keys() == {0}
+    assert window.groups[0].keys() == {0}
+
+    assert window.sweep(1500, 5)
+    assert window.groups == {}